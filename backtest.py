@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Replay historical decodes through selector plugins, slot by slot, and
+report what would have been called and what the called station did in
+the following slots: answer us, answer someone else, call CQ again or
+disappear. The hit rate only counts the stations answering us.
+
+The decodes are read from a JSON lines file sorted by time, as produced
+by `mongoexport --collection history --sort '{_id: 1}'`, one bucket of
+decodes per line. Files of decode documents, one per line, are also
+accepted. The file can be gzip compressed, it is streamed.
+
+The reply statistics, the stations worked and the contest state start
+empty and are built from the replayed decodes, on the replayed clock.
+The contest state is kept in memory, every station answering us is
+logged as a QSO.
+
+Each selector runs in its own process. A selector can be given its own
+parameters as a YAML mapping replacing its configuration section:
+
+  backtest.py decodes.json any.Any grid.Grid 'grid.Grid:{squares: [^J]}'
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import Counter
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+import contest
+import cty
+import geo
+import history
+import logbook
+import plugins
+import stats
+
+from config import Config
+
+LOG = logging.getLogger('Backtest')
+
+SLOT_LENGTH = 15
+LOOKAHEAD = 2                   # Number of slots watched after a call
+BLACKLIST_TIME = 1800           # Same as the ftconsole purge
+
+
+def read_decodes(filename):
+  """Generator returning the decodes of the file"""
+  opener = gzip.open if filename.endswith('.gz') else open
+  with opener(filename, 'rt') as fdin:
+    for line in fdin:
+      line = line.strip()
+      if not line:
+        continue
+      obj = json.loads(line)
+      if 'd' in obj:
+        yield from history.expand(obj)
+        continue
+      obj.pop('_id', None)
+      obj.pop('Time', None)
+      yield obj
+
+
+def read_slots(filename):
+  """Generator returning (slot id, decodes) in the order of the file"""
+  slot_id, decodes = None, []
+  for obj in read_decodes(filename):
+    current = int(obj['timestamp']) // SLOT_LENGTH
+    if current != slot_id and decodes:
+      yield slot_id, decodes
+      decodes = []
+    slot_id = current
+    decodes.append(obj)
+  if decodes:
+    yield slot_id, decodes
+
+
+def locate(records, here):
+  """Add the distance, direction and entity not stored in the history"""
+  countries = cty.CountryFile()
+  for obj in records:
+    if 'distance' not in obj:
+      try:
+        there = geo.grid2latlon(obj['grid'])
+      except (KeyError, ValueError, AssertionError):
+        continue
+      obj['distance'] = geo.distance(here, there)
+      obj['direction'] = geo.azimuth(here, there)
+    if countries and 'entity' not in obj:
+      entity = countries.lookup(obj['call'])
+      if entity:
+        obj['entity'], obj['continent'], obj['cqzone'] = (entity.name, entity.continent,
+                                                          entity.cqzone)
+
+
+def outcome(call, my_call, next_slots):
+  """What the station did after we called it, and in which slot"""
+  for slot_id, slot in next_slots:
+    for obj in slot:
+      if obj['call'] != call:
+        continue
+      if obj['to'] == my_call:
+        return 'us', slot_id
+      if obj['to'] != 'CQ':
+        return 'other', slot_id
+      return 'cq', slot_id
+  return 'gone', None
+
+
+def reset_state():
+  """Start with empty reply statistics, logbook and contest state"""
+  config = Config()
+  for key in ('stats_file', 'adif_file', 'contest_file'):
+    config.config_data.pop(key, None)
+  # A worker process runs several backtests
+  for klass in (stats.ReplyStats, logbook.WorkedBefore, contest.Contest):
+    klass._instance = None      # pylint: disable=protected-access
+  contest.Contest(in_memory=True)
+
+
+def backtest(spec, filename, my_call):
+  name, _, params = spec.partition(':')
+  config = Config()
+  klass = plugins.get_class(name)
+  if params:
+    config.config_data[klass.__name__] = yaml.safe_load(params)
+  selector = klass(config, None)
+  if klass.is_legacy():
+    raise TypeError('{} overrides get() and cannot be backtested'.format(name))
+
+  reset_state()
+  here = geo.grid2latlon(config.location)
+  start = time.perf_counter()
+  results = Counter()
+  black = {}
+  replies = defaultdict(list)   # slot id: records of the stations answering us
+
+  def replay(slot_id, decodes, next_slots):
+    now = slot_id * SLOT_LENGTH
+    for reply_slot in [k for k in replies if k <= slot_id]:
+      for record in replies.pop(reply_slot):
+        stats.ReplyStats().replied(record['call'], now)
+        logbook.WorkedBefore().add(record['call'], record.get('band'),
+                                   logbook.MODES.get(record.get('Mode'), record.get('Mode', '')),
+                                   record.get('grid'))
+        contest.Contest().log(record['call'], record.get('band'), record.get('grid'),
+                              record.get('entity'))
+    # Latest CQ of each call during the slot
+    records = list({obj['call']: obj for obj in decodes if obj['to'] == 'CQ'}.values())
+    if not records:
+      return
+    locate(records, here)
+    for obj in records:
+      obj['black'] = black.get(obj['call'], 0) > now - BLACKLIST_TIME
+    plugins.CallSelector.annotate(records, now)
+
+    results['slots'] += 1
+    idx = selector.select(plugins.Snapshot.from_records(records))
+    if idx is None:
+      results['no call'] += 1
+      return
+    record = records[idx]
+    black[record['call']] = now
+    stats.ReplyStats().called(record, record.get('band'), now)
+    result, reply_slot = outcome(record['call'], my_call, next_slots)
+    results[result] += 1
+    if result == 'us':
+      replies[reply_slot].append(record)
+
+  window = deque()
+  for slot in read_slots(filename):
+    window.append(slot)
+    while window[-1][0] - window[0][0] > LOOKAHEAD:
+      slot_id, decodes = window.popleft()
+      replay(slot_id, decodes, [s for s in window if s[0] - slot_id <= LOOKAHEAD])
+  while window:
+    slot_id, decodes = window.popleft()
+    replay(slot_id, decodes, list(window))
+
+  results['elapsed'] = time.perf_counter() - start
+  return spec, results
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Selector backtesting',
+                                   epilog=__doc__.split('\n\n', 1)[1],
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('-c', '--call', help='Operator call sign (default from the configuration)')
+  parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                      help='Number of worker processes')
+  parser.add_argument('decodes', help='JSON lines decodes file')
+  parser.add_argument('selectors', nargs='+', help='Selectors <module.name>.<class>[:params]')
+  opts = parser.parse_args()
+
+  logging.basicConfig(level=logging.WARNING)
+  my_call = opts.call or Config().get('call', 'N0CALL')
+
+  print('{:30s} {:>7s} {:>7s} {:>7s} {:>7s} {:>7s} {:>7s} {:>7s} {:>8s}'.format(
+    'Selector', 'Slots', 'NoCall', 'Us', 'Other', 'CQ', 'Gone', 'Hit %', 'Time'))
+  with ProcessPoolExecutor(max_workers=opts.workers) as pool:
+    jobs = [pool.submit(backtest, spec, opts.decodes, my_call) for spec in opts.selectors]
+    for job in jobs:
+      try:
+        spec, res = job.result()
+      except (TypeError, AttributeError, ImportError, ValueError) as err:
+        print('Error: {}'.format(err), file=sys.stderr)
+        continue
+      calls = res['us'] + res['other'] + res['cq'] + res['gone']
+      hit_rate = 100 * res['us'] / calls if calls else 0
+      print('{:30s} {:7d} {:7d} {:7d} {:7d} {:7d} {:7d} {:7.1f} {:7.2f}s'.format(
+        spec[:30], res['slots'], res['no call'], res['us'], res['other'], res['cq'],
+        res['gone'], hit_rate, res['elapsed']))
+
+
+if __name__ == "__main__":
+  main()
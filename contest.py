@@ -0,0 +1,109 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Contest dupes and multipliers.
+
+The worked grid squares of each band are kept in a 32,400 bits bitmap,
+the worked calls in a set of crc32 hashes and the worked entities in a
+set of names. The state is saved to the `contest_file` after every QSO
+and reloaded at startup.
+"""
+
+import logging
+import os
+import pickle
+import zlib
+
+from collections import defaultdict
+
+import geo
+
+from config import Config
+
+LOG = logging.getLogger('Contest')
+
+BITMAP_SIZE = (geo.NB_SQUARES + 7) // 8
+
+
+def call_hash(call):
+  return zlib.crc32(call.upper().encode('utf-8'))
+
+
+class Contest:
+  """Singleton, enabled by the `contest_file` configuration key, or kept
+  in memory only when `in_memory` is set"""
+  _instance = None
+
+  def __new__(cls, *args, **kwargs):
+    if cls._instance is None:
+      cls._instance = super(Contest, cls).__new__(cls)
+      cls._instance.grids = None
+    return cls._instance
+
+  def __init__(self, filename=None, in_memory=False):
+    if self.grids is not None:
+      return
+
+    self.grids = defaultdict(lambda: bytearray(BITMAP_SIZE))
+    self.calls = defaultdict(set)
+    self.entities = defaultdict(set)
+    self.filename = filename or Config().get('contest_file')
+    self.enabled = bool(self.filename) or in_memory
+    if self.filename:
+      self.filename = os.path.expanduser(self.filename)
+      if os.path.exists(self.filename):
+        self.load()
+
+  def __bool__(self):
+    return self.enabled
+
+  def log(self, call, band, grid=None, entity=None):
+    self.calls[band].add(call_hash(call))
+    index = geo.square_index(grid[:4].upper()) if grid else -1
+    if index >= 0:
+      self.grids[band][index >> 3] |= 1 << (index & 7)
+    if entity:
+      self.entities[band].add(entity)
+    if self.filename:
+      self.save()
+
+  # The readers don't use the defaultdict, they run in the transmit thread.
+  def is_dupe(self, call, band):
+    return call_hash(call) in self.calls.get(band, ())
+
+  def is_new_grid(self, grid, band):
+    index = geo.square_index(grid[:4])
+    bitmap = self.grids.get(band)
+    if index < 0 or bitmap is None:
+      return index >= 0
+    return not bitmap[index >> 3] & 1 << (index & 7)
+
+  def is_new_entity(self, entity, band):
+    return bool(entity) and entity not in self.entities.get(band, ())
+
+  def save(self):
+    state = {
+      'grids': {band: bytes(bitmap) for band, bitmap in self.grids.items()},
+      'calls': {band: sorted(hashes) for band, hashes in self.calls.items()},
+      'entities': {band: sorted(names) for band, names in self.entities.items()},
+    }
+    tmp_file = self.filename + '.tmp'
+    with open(tmp_file, 'wb') as fdout:
+      pickle.dump(state, fdout, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, self.filename)
+
+  def load(self):
+    with open(self.filename, 'rb') as fdin:
+      state = pickle.load(fdin)
+    for band, bitmap in state['grids'].items():
+      self.grids[band] = bytearray(bitmap)
+    for band, hashes in state['calls'].items():
+      self.calls[band] = set(hashes)
+    for band, names in state['entities'].items():
+      self.entities[band] = set(names)
+    LOG.info('Contest state loaded from %s: %d QSOs', self.filename,
+             sum(len(c) for c in self.calls.values()))
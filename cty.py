@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Resolve a callsign into its DXCC entity, zones and continent using a
+country file in the cty.dat format (https://www.country-files.com).
+
+The prefixes are loaded into a trie, the exact calls (`=CALL`) are kept
+in a dictionary. Lookups are memoized.
+
+Usage: cty.py cty.dat [CALL ...]
+  benchmark the number of lookups per second.
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+
+from collections import namedtuple
+from functools import lru_cache
+
+from config import Config
+
+LOG = logging.getLogger('CTY')
+
+CACHE_SIZE = 16384
+
+Entity = namedtuple('Entity', 'name cqzone ituzone continent lat lon prefix')
+
+# Overrides following a prefix: (CQ zone) [ITU zone] <lat/lon> {continent} ~tz~
+RE_ALIAS = re.compile(r'^(?P<exact>=?)(?P<prefix>[A-Z0-9/]+)(?:\((?P<cq>\d+)\)|\[(?P<itu>\d+)\]'
+                      r'|<(?P<lat>[-.\d]+)/(?P<lon>[-.\d]+)>|\{(?P<cont>\w+)\}|~[-.\d]+~)*$')
+
+# Suffixes not changing the entity
+IGNORE_SUFFIXES = {'P', 'M', 'MM', 'AM', 'QRP', 'A', 'B', 'LH'}
+
+
+class CountryFile:
+  """Singleton loaded from the `cty_file` configuration key"""
+  _instance = None
+
+  def __new__(cls, *args, **kwargs):
+    if cls._instance is None:
+      cls._instance = super(CountryFile, cls).__new__(cls)
+      cls._instance.root = None
+    return cls._instance
+
+  def __init__(self, filename=None):
+    if self.root is not None:
+      return
+
+    self.root = {}
+    self.exact = {}
+    self.lookup = lru_cache(maxsize=CACHE_SIZE)(self._lookup)
+    filename = filename or Config().get('cty_file')
+    if not filename:
+      return
+    filename = os.path.expanduser(filename)
+    if not os.path.exists(filename):
+      LOG.warning('Country file %s not found, the decodes are not tagged', filename)
+      return
+    self.load(filename)
+
+  def __bool__(self):
+    return bool(self.root)
+
+  def load(self, filename):
+    with open(filename, 'r', encoding='latin-1') as fdin:
+      data = fdin.read()
+
+    count = 0
+    for record in data.split(';'):
+      if ':' not in record:
+        continue
+      *fields, aliases = record.split(':')
+      name, cqzone, ituzone, cont, lat, lon, _tz, prefix = [f.strip() for f in fields]
+      # cty.dat longitudes are positive to the west
+      entity = Entity(name, int(cqzone), int(ituzone), cont, float(lat), -float(lon),
+                      prefix.lstrip('*'))
+      for alias in aliases.split(','):
+        self._add(alias.strip(), entity)
+      count += 1
+
+    self.lookup.cache_clear()
+    LOG.info('%d entities, %d exact calls loaded from %s', count, len(self.exact), filename)
+
+  def _add(self, alias, entity):
+    match = RE_ALIAS.match(alias)
+    if not match:
+      if alias:
+        LOG.warning('Cannot parse prefix "%s" of %s', alias, entity.name)
+      return
+    over = match.groupdict()
+    overrides = {}
+    if over['cq']:
+      overrides['cqzone'] = int(over['cq'])
+    if over['itu']:
+      overrides['ituzone'] = int(over['itu'])
+    if over['lat']:
+      overrides['lat'], overrides['lon'] = float(over['lat']), -float(over['lon'])
+    if over['cont']:
+      overrides['continent'] = over['cont']
+    if overrides:
+      entity = entity._replace(**overrides)
+
+    if over['exact']:
+      self.exact[over['prefix']] = entity
+      return
+
+    node = self.root
+    for char in over['prefix']:
+      node = node.setdefault(char, {})
+    node[None] = entity
+
+  def _longest_prefix(self, call):
+    entity = None
+    node = self.root
+    for char in call:
+      node = node.get(char)
+      if node is None:
+        break
+      entity = node.get(None, entity)
+    return entity
+
+  def _lookup(self, call):
+    call = call.upper()
+    if call in self.exact:
+      return self.exact[call]
+
+    if '/' in call:
+      parts = [p for p in call.split('/') if p and p not in IGNORE_SUFFIXES and not p.isdigit()]
+      if not parts:
+        return None
+      # With a prefix like EA8/W6BSD the shortest part gives the entity
+      call = min(parts, key=len) if len(parts) > 1 else parts[0]
+      if call in self.exact:
+        return self.exact[call]
+    return self._longest_prefix(call)
+
+
+def main():
+  logging.basicConfig(level=logging.INFO)
+  if len(sys.argv) < 2:
+    print(__doc__)
+    sys.exit(os.EX_USAGE)
+
+  countries = CountryFile(sys.argv[1])
+  calls = sys.argv[2:] or ['W6BSD', 'JA1XYZ', 'EA8/W6BSD', 'VK2ABC/P', 'F4ABC', 'ZL1AA',
+                           'PY2XX', 'UA9ABC', '9A1AA', 'KH6XX', 'VE3ABC', 'G4ABC']
+  for call in calls:
+    print('{:12s} {}'.format(call, countries.lookup(call)))
+
+  loops = 200000
+  for label, func in (('Cold', countries._lookup), ('Memoized', countries.lookup)):
+    start = time.perf_counter()
+    for idx in range(loops):
+      func(calls[idx % len(calls)])
+    elapsed = time.perf_counter() - start
+    print('{:9s} {:10,.0f} lookups/sec'.format(label, loops / elapsed))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,133 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Append only decision log.
+
+Every slot, the transmit thread records one JSON line with the
+candidates and their scores, the chosen call, the reason of the choice
+and the time spent in each stage. The lines are written by a background
+thread. When the file reaches its maximum size it is rotated and
+compressed: decisions.jsonl.1.gz, decisions.jsonl.2.gz...
+
+  for record in decisionlog.read('decisions.jsonl'):
+    print(record['call'], record['reason'])
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+LOG = logging.getLogger('DecisionLog')
+
+DECISION_FILE = 'decisions.jsonl'
+MAX_SIZE = 10 << 20
+BACKUP_COUNT = 5
+QUEUE_SIZE = 1024
+
+
+class Decision:
+  """Collect the information about one slot"""
+
+  def __init__(self):
+    self.record = {'t': int(time.time()), 'reason': None, 'call': None, 'ms': {}}
+    self._mark = time.perf_counter()
+
+  def stage(self, name):
+    now = time.perf_counter()
+    self.record['ms'][name] = round((now - self._mark) * 1000, 3)
+    self._mark = now
+
+  def candidates(self, snapshot, scores):
+    if snapshot is None or scores is None:
+      return
+    self.record['cand'] = [[str(call), round(float(score), 1)]
+                           for call, score in zip(snapshot.call, scores) if score > float('-inf')]
+
+  def done(self, reason, call=None):
+    self.record['reason'] = reason
+    self.record['call'] = call
+    return self.record
+
+
+class DecisionLog(threading.Thread):
+
+  def __init__(self, filename=DECISION_FILE, max_size=MAX_SIZE, backup_count=BACKUP_COUNT):
+    super().__init__(daemon=True, name='DecisionLog')
+    self.filename = filename
+    self.max_size = max_size
+    self.backup_count = backup_count
+    self.dropped = 0
+    self._queue = queue.Queue(QUEUE_SIZE)
+    self._fdout = None
+
+  def write(self, record):
+    """Queue the record, never blocks the caller"""
+    try:
+      self._queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+
+  def shutdown(self):
+    self._queue.put(None)
+
+  def run(self):
+    self._fdout = open(self.filename, 'a')
+    while True:
+      record = self._queue.get()
+      if record is None:
+        break
+      lines = [record]
+      # Write what is already waiting in one go
+      while not self._queue.empty():
+        lines.append(self._queue.get_nowait())
+      if None in lines:
+        lines = lines[:lines.index(None)]
+        self._write(lines)
+        break
+      self._write(lines)
+    self._fdout.close()
+
+  def _write(self, records):
+    for record in records:
+      self._fdout.write(json.dumps(record, separators=(',', ':')) + '\n')
+    self._fdout.flush()
+    if self._fdout.tell() >= self.max_size:
+      self.rotate()
+
+  def rotate(self):
+    self._fdout.close()
+    for idx in range(self.backup_count - 1, 0, -1):
+      src = '{}.{}.gz'.format(self.filename, idx)
+      if os.path.exists(src):
+        os.replace(src, '{}.{}.gz'.format(self.filename, idx + 1))
+    with open(self.filename, 'rb') as fdin, gzip.open(self.filename + '.1.gz', 'wb') as fdgz:
+      shutil.copyfileobj(fdin, fdgz)
+    self._fdout = open(self.filename, 'w')
+    LOG.info('Decision log %s rotated', self.filename)
+
+
+def read(filename):
+  """Iterate over the records of the log and its rotated files, oldest first"""
+  files = []
+  idx = 1
+  while os.path.exists('{}.{}.gz'.format(filename, idx)):
+    files.insert(0, '{}.{}.gz'.format(filename, idx))
+    idx += 1
+  if os.path.exists(filename):
+    files.append(filename)
+
+  for name in files:
+    opener = gzip.open if name.endswith('.gz') else open
+    with opener(name, 'rt') as fdin:
+      for line in fdin:
+        if line.strip():
+          yield json.loads(line)
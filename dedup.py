@@ -0,0 +1,82 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Drop the decodes already seen.
+
+WSJT-X sends the same message more than once: replays when a client
+connects (New=False), re-decodes after a settings change, several
+decoder passes over the same slot. The filter runs on the raw decode
+packets, before the parsing and the database write.
+
+The key is the slot start time and the message, the message carries the
+call. Only the hashes of the current and previous slots are kept, the
+older ones expire when a new slot starts. WSJT-X sends the time of the
+day, dated today: a late decode of the last slot before midnight comes
+dated tomorrow, the slots are compared by time of the day.
+"""
+
+import logging
+import time
+
+from collections import Counter
+
+LOG = logging.getLogger('Dedup')
+
+MAX_SIZE = 4096                 # Maximum number of keys per slot
+LOG_INTERVAL = 900
+
+
+class DecodeFilter:
+
+  def __init__(self, max_size=MAX_SIZE):
+    self.max_size = max_size
+    self.counters = Counter(accepted=0, duplicate=0, replay=0, offair=0, overflow=0)
+    self._slot = None
+    self._previous_slot = None
+    self._current = set()
+    self._previous = set()
+    self._last_log = time.time()
+
+  def accept(self, packet):
+    """Return False when the decode packet must be dropped"""
+    if packet.OffAir:
+      self.counters['offair'] += 1
+      return False
+    if not packet.New:
+      self.counters['replay'] += 1
+      return False
+
+    slot = packet.Time.hour * 3600 + packet.Time.minute * 60 + packet.Time.second
+    if slot not in (self._slot, self._previous_slot):
+      self._previous, self._current = self._current, set()
+      self._previous_slot, self._slot = self._slot, slot
+
+    key = hash((slot, packet.Message))
+    if key in self._current or key in self._previous:
+      self.counters['duplicate'] += 1
+      return False
+
+    if len(self._current) < self.max_size:
+      self._current.add(key)
+    else:
+      self.counters['overflow'] += 1
+    self.counters['accepted'] += 1
+    return True
+
+  @property
+  def dropped(self):
+    return self.counters['duplicate'] + self.counters['replay'] + self.counters['offair']
+
+  def log(self, now=None):
+    """Log the counters every LOG_INTERVAL seconds"""
+    now = now or time.time()
+    if now - self._last_log < LOG_INTERVAL:
+      return
+    self._last_log = now
+    LOG.info('Decodes accepted: %d, dropped: %d (duplicate: %d, replay: %d, offair: %d)',
+             self.counters['accepted'], self.dropped, self.counters['duplicate'],
+             self.counters['replay'], self.counters['offair'])
@@ -0,0 +1,152 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+# See licence file for more information.
+#
+"""
+Run the call selector plugins against a per slot time budget.
+CPU heavy selectors can run in a worker process, they only receive the
+columnar snapshot of the slot and send back the index of the chosen call.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+import logsetup
+import metrics
+import timeline
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from config import Config
+from plugins import CallSelector
+from plugins import Snapshot
+
+LOG = logging.getLogger('Executor')
+
+SELECTOR_BUDGET = 1.5           # Seconds
+SLOT_LENGTH = 15
+
+_WORKER_SELECTOR = None
+
+def _init_worker(klass, log_queue, log_level):
+  global _WORKER_SELECTOR       # pylint: disable=global-statement
+  logsetup.worker_setup(log_queue, log_level)
+  _WORKER_SELECTOR = klass(Config(), None)
+
+def _worker_select(snapshot):
+  idx = _WORKER_SELECTOR.select(snapshot)
+  return idx, _WORKER_SELECTOR.scores
+
+def _worker_ping():
+  return True
+
+
+def quick_pick(snapshot, mask):
+  """Index of the best candidate by distance and SNR among the ones the
+  selector accepts, the cheap answer used when it overruns its budget"""
+  if mask is None or not len(snapshot):
+    return None
+  scores = np.where(snapshot.black | snapshot.dupe | ~mask, -np.inf,
+                    CallSelector.coefficient(snapshot.distance, snapshot.SNR))
+  idx = int(np.argmax(scores))
+  return None if scores[idx] == -np.inf else idx
+
+
+class SelectorExecutor:
+  """Call the selector in a worker thread and give up when the budget
+  is exhausted. As soon as the snapshot of the slot is built, a quick
+  candidate is picked from it with the selector's quick mask, it is the
+  answer of the slot when the selector overruns. Without a quick mask
+  there is no transmission."""
+
+  def __init__(self, selector, budget=SELECTOR_BUDGET, process=False):
+    self.selector = selector
+    self.name = selector.__class__.__name__
+    self.budget = budget
+    self.overruns = 0
+    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Selector')
+    self._procs = None
+    self._future = None
+    self._started = 0
+    self._quick = (0, None)       # (start of the selection, record)
+
+    if process and selector.is_legacy():
+      LOG.error('Selector %s overrides get(), running in a thread', self.name)
+    elif process:
+      self._procs = ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                        initargs=(selector.__class__, logsetup.process_queue(),
+                                                  logging.getLogger().level))
+      # Start the worker now, before the other threads are running.
+      self._procs.submit(_worker_ping).result()
+      LOG.info('Selector %s running in a worker process', self.name)
+
+  def __repr__(self):
+    return "<{} {} budget: {:.2f}s overruns: {}>".format(
+      self.__class__.__name__, self.name, self.budget, self.overruns)
+
+  def get(self):
+    """Return the chosen call with the snapshot and the scores it was
+    chosen from. After an overrun the snapshot and scores are None."""
+    start = time.monotonic()
+    if self._future and not self._future.done():
+      # The previous call is still running, don't pile them up.
+      self.overrun(start - self._started)
+      return self.fallback()
+
+    self._started = start
+    self._future = self._pool.submit(self._select, start)
+    try:
+      result = self._future.result(timeout=self.budget)
+    except FutureTimeout:
+      metrics.SELECTOR_LATENCY.observe(time.monotonic() - start)
+      self.overrun(time.monotonic() - start)
+      return self.fallback()
+    except Exception:           # pylint: disable=broad-except
+      LOG.exception('Selector %s failed', self.name)
+      return self.fallback()
+
+    metrics.SELECTOR_LATENCY.observe(time.monotonic() - start)
+    return result
+
+  def _select(self, start):
+    if self.selector.is_legacy():
+      return self.selector.get(), None, None
+    records = self.selector.fetch()
+    snapshot = Snapshot.from_records(records)
+    timeline.mark('snapshot')
+    idx = quick_pick(snapshot, self.selector.quick_mask(snapshot))
+    self._quick = (start, None if idx is None else records[idx])
+    if self._procs:
+      idx, scores = self._procs.submit(_worker_select, snapshot).result()
+    else:
+      idx = self.selector.select(snapshot)
+      scores = self.selector.scores
+    timeline.mark('selector')
+    return None if idx is None else records[idx], snapshot, scores
+
+  def overrun(self, elapsed):
+    self.overruns += 1
+    LOG.warning('Selector %s overrun: %.3fs (budget %.3fs)', self.name, elapsed, self.budget,
+                extra={'stage': 'selector', 'latency': elapsed})
+
+  def fallback(self):
+    """Return the quick candidate of this slot, or None (no transmission)"""
+    (start, call), self._quick = self._quick, (0, None)
+    if not call or time.monotonic() - start > SLOT_LENGTH:
+      return None, None, None
+    if call.get('timestamp', 0) <= CallSelector.timestamp() - SLOT_LENGTH:
+      return None, None, None
+    LOG.info('Selector %s fallback: %s', self.name, call['call'])
+    return call, None, None
+
+  def shutdown(self):
+    self._pool.shutdown(wait=False)
+    if self._procs:
+      self._procs.shutdown(wait=False)
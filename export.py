@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Export the decodes to Parquet files for offline analysis.
+
+The `calls`, `black` and `history` collections are read with batched
+cursors and written in one directory per collection, partitioned by day
+and band:
+
+  <output>/calls/day=2021-12-01/band=20m/part-<start>-<end>.parquet
+
+Each run only exports the documents newer than the watermark saved by
+the previous run in <output>/_watermarks.json. Requires pyarrow.
+
+  export.py ~/ft8-parquet
+  export.py --collection history --full ~/ft8-parquet
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from collections import Counter
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import ASCENDING
+from pymongo import MongoClient
+
+import history
+
+from config import Config
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = None
+
+LOG = logging.getLogger('Export')
+
+BATCH_SIZE = 5000
+MAX_ROWS = 50000                # Rows kept in memory before writing
+SETTLE_TIME = 60                # The most recent documents can still change
+WATERMARK_FILE = '_watermarks.json'
+
+# Collection: (time field, ((column, type), ...))
+COLLECTIONS = {
+  'calls': ('timestamp', (
+    ('timestamp', 'int64'), ('call', 'string'), ('to', 'string'), ('grid', 'string'),
+    ('SNR', 'int32'), ('DeltaTime', 'float64'), ('DeltaFrequency', 'int32'), ('Mode', 'string'),
+    ('Message', 'string'), ('band', 'string'), ('distance', 'float64'),
+    ('direction', 'int32'), ('lat', 'float64'), ('lon', 'float64'), ('entity', 'string'),
+    ('continent', 'string'), ('cqzone', 'int32'),
+  )),
+  'black': ('time', (
+    ('time', 'int64'), ('call', 'string'), ('logged', 'bool'),
+  )),
+  'history': ('_id', (
+    ('timestamp', 'int64'), ('call', 'string'), ('to', 'string'), ('grid', 'string'),
+    ('extra', 'string'), ('snr', 'string'), ('R', 'string'), ('R73', 'string'),
+    ('SNR', 'int32'), ('DeltaTime', 'float64'), ('DeltaFrequency', 'int32'), ('Mode', 'string'),
+    ('Message', 'string'), ('band', 'string'),
+  )),
+}
+
+
+def flatten(name, obj):
+  """Rows of a document, the history buckets contain several decodes"""
+  if name == 'history':
+    return list(history.expand(obj))
+  if 'coordinates' in obj:
+    obj['lon'], obj['lat'] = obj['coordinates']['coordinates']
+  return [obj]
+
+
+class PartitionWriter:
+  """Buffer the rows by partition and append them to one Parquet file per partition.
+  The rows come sorted by time, the files of a day are closed when the
+  next day starts."""
+
+  def __init__(self, directory, columns, suffix):
+    self.directory = directory
+    # The band is only in the partition path
+    self.schema = pa.schema([(column, pa.type_for_alias(dtype)) for column, dtype in columns
+                             if column != 'band'])
+    self.suffix = suffix
+    self.buffers = defaultdict(list)
+    self.writers = {}
+    self.parts = Counter()        # Files written per partition
+    self.day = None
+    self.size = 0
+    self.rows = 0
+
+  def add(self, row, stamp):
+    day = datetime.utcfromtimestamp(stamp).strftime('%Y-%m-%d')
+    if day != self.day:
+      self.close_days(day)
+      self.day = day
+    self.buffers[(day, row.get('band') or 'none')].append(row)
+    self.size += 1
+    if self.size >= MAX_ROWS:
+      self.flush()
+
+  def flush(self):
+    for key, rows in self.buffers.items():
+      if key not in self.writers:
+        path = os.path.join(self.directory, 'day={}'.format(key[0]), 'band={}'.format(key[1]))
+        os.makedirs(path, exist_ok=True)
+        # A late row reopens the partition in a new file
+        part = self.suffix + ('-{}'.format(self.parts[key]) if self.parts[key] else '')
+        self.parts[key] += 1
+        self.writers[key] = pq.ParquetWriter(
+          os.path.join(path, 'part-{}.parquet'.format(part)), self.schema)
+      columns = {name: [row.get(name) for row in rows] for name in self.schema.names}
+      self.writers[key].write_table(pa.table(columns, schema=self.schema))
+      self.rows += len(rows)
+    self.buffers.clear()
+    self.size = 0
+
+  def close_days(self, day):
+    """Close the files of the other days"""
+    self.flush()
+    for key in [k for k in self.writers if k[0] != day]:
+      self.writers.pop(key).close()
+
+  def close(self):
+    self.flush()
+    for writer in self.writers.values():
+      writer.close()
+    self.writers.clear()
+
+
+def export(db, name, output, start, end, full=False):
+  """Export the documents from start to end. A full export is written in
+  a new directory replacing the previous export of the collection."""
+  field, columns = COLLECTIONS[name]
+  directory = os.path.join(output, name)
+  if full:
+    directory += '.tmp'
+    shutil.rmtree(directory, ignore_errors=True)
+  request = {field: {'$gte': start, '$lt': end}}
+  cursor = db[name].find(request, batch_size=BATCH_SIZE).sort(field, ASCENDING)
+  writer = PartitionWriter(directory, columns, '{}-{}'.format(start, end))
+  try:
+    for obj in cursor:
+      for row in flatten(name, obj):
+        writer.add(row, row[field] if field in row else row['timestamp'])
+  finally:
+    writer.close()
+  if full:
+    shutil.rmtree(os.path.join(output, name), ignore_errors=True)
+    if os.path.exists(directory):
+      os.replace(directory, os.path.join(output, name))
+  return writer.rows
+
+
+def load_watermarks(output):
+  try:
+    with open(os.path.join(output, WATERMARK_FILE)) as fdin:
+      return json.load(fdin)
+  except FileNotFoundError:
+    return {}
+
+
+def save_watermarks(output, watermarks):
+  filename = os.path.join(output, WATERMARK_FILE)
+  with open(filename + '.tmp', 'w') as fdout:
+    json.dump(watermarks, fdout)
+  os.replace(filename + '.tmp', filename)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Export the decodes to Parquet',
+                                   epilog=__doc__.split('\n\n', 1)[1],
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--collection', action='append', choices=list(COLLECTIONS),
+                      help='Collection to export (default: all)')
+  parser.add_argument('--full', action='store_true',
+                      help='Ignore the watermark and replace the previous export')
+  parser.add_argument('output', help='Output directory')
+  opts = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO)
+  if pa is None:
+    print('The export needs pyarrow: pip install pyarrow', file=sys.stderr)
+    sys.exit(os.EX_UNAVAILABLE)
+
+  db = MongoClient(Config().mongo_server).wsjt
+  os.makedirs(opts.output, exist_ok=True)
+  watermarks = load_watermarks(opts.output)
+  end = int(time.time()) - SETTLE_TIME
+  if 'history' in (opts.collection or COLLECTIONS):
+    # Only the complete buckets
+    end -= end % history.BUCKET_SIZE
+  for name in opts.collection or COLLECTIONS:
+    start = 0 if opts.full else watermarks.get(name, 0)
+    timer = time.perf_counter()
+    rows = export(db, name, opts.output, start, end, opts.full)
+    elapsed = time.perf_counter() - timer
+    watermarks[name] = end
+    save_watermarks(opts.output, watermarks)
+    print('{:8s} {:10,d} rows {:7.2f}s {:10,.0f} rows/sec'.format(
+      name, rows, elapsed, rows / elapsed if elapsed else 0))
+
+
+if __name__ == "__main__":
+  main()
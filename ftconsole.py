@@ -39,6 +39,8 @@ CONFIG = Config()
 SRV_ADDR = (CONFIG.bind_address, CONFIG.monitor_port)
 DB = MongoClient(CONFIG.mongo_server).wsjt
 
+PROFILE_TIME = 30
+
 TEXT_STYLE = """QTextBrowser {
   background-color: rgb(0, 0, 30);
   border-color: rgb(0, 0, 0);
@@ -121,6 +123,15 @@ class FTCtl(QMainWindow):
     clearAction.setStatusTip('Clear screen')
     clearAction.triggered.connect(self.clear)
 
+    activityAction=QAction('Activity', self)
+    activityAction.setShortcut('Ctrl+A')
+    activityAction.setStatusTip('Activity of the current hour')
+    activityAction.triggered.connect(self.activity)
+
+    profileAction=QAction('Profile', self)
+    profileAction.setStatusTip('Profile the sequencer for {} seconds'.format(PROFILE_TIME))
+    profileAction.triggered.connect(self.profile)
+
     aboutAction=QAction('About', self)
     aboutAction.setStatusTip('About')
     aboutAction.triggered.connect(self.about)
@@ -131,6 +142,8 @@ class FTCtl(QMainWindow):
     tb1.addAction(skipAction)
     tb1.addAction(purgeAction)
     tb1.addAction(clearAction)
+    tb1.addAction(activityAction)
+    tb1.addAction(profileAction)
 
     tb2 = self.addToolBar('About')
     tb2.addAction(aboutAction)
@@ -222,6 +235,22 @@ class FTCtl(QMainWindow):
 
     self.print('Skip call...'.format(sqs.call))
 
+  def activity(self):
+    hour = int(time.time()) // 3600 * 3600
+    for doc in DB.activity.find({"hour": hour}).sort("band"):
+      counts = sorted(doc['continent'].items(), key=lambda c: -c[1][0])
+      line = ' '.join('{}: {:.0f} CQ {:.0f} calls {:+.0f}dB'.format(cont, c[1], c[2], c[3] / c[0])
+                      for cont, c in counts)
+      self.print('<b>{:4s}</b> {}'.format(doc['band'], line))
+
+  def profile(self):
+    try:
+      self.sock.sendto(self.status.profile(PROFILE_TIME), SRV_ADDR)
+    except (socket.timeout, socket.error) as err:
+      self.statusBar().showMessage('Connection {} the sequencer is not running'.format(err))
+      return
+    self.print("Profiling the sequencer for {} seconds...".format(PROFILE_TIME))
+
   def clear(self):
     self.textLog.setText('')
 
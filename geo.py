@@ -11,6 +11,12 @@ Spherical geometry
 
 import math
 
+from functools import lru_cache
+
+import numpy as np
+
+NB_SQUARES = 18 * 18 * 10 * 10
+
 
 def distance(orig, dest):
   """Calculate the distance between 2 coordinates"""
@@ -39,7 +45,7 @@ def azimuth(orig, dest):
        math.cos(math.radians(d_lon)))
   brng = math.atan2(x, y)
   brng = math.degrees(brng)
-  return abs(int(brng))
+  return int(brng) % 360
 
 def grid2latlon(maiden):
   """ Transform a maidenhead grid locator to latitude & longitude """
@@ -67,3 +73,59 @@ def grid2latlon(maiden):
     lat += int(maiden[7]) * 2.5 / 600
 
   return lat, lon
+
+def square_index(square):
+  """Index of a 4 characters grid square in the NB_SQUARES squares of the world.
+  Returns -1 for an invalid square."""
+  if len(square) != 4:
+    return -1
+  field1, field2 = ord(square[0]) - 65, ord(square[1]) - 65
+  digit1, digit2 = ord(square[2]) - 48, ord(square[3]) - 48
+  if not (0 <= field1 < 18 and 0 <= field2 < 18 and 0 <= digit1 < 10 and 0 <= digit2 < 10):
+    return -1
+  return ((field1 * 18 + field2) * 10 + digit1) * 10 + digit2
+
+def index_square(index):
+  """Grid square from its index, the reverse of `square_index`"""
+  index, digit2 = divmod(index, 10)
+  index, digit1 = divmod(index, 10)
+  field1, field2 = divmod(index, 18)
+  return '{}{}{}{}'.format(chr(65 + field1), chr(65 + field2), digit1, digit2)
+
+def square_latlon(index):
+  """Latitude and longitude of the center of the squares. `index` is a
+  numpy array of square indexes"""
+  index, digit2 = np.divmod(index, 10)
+  index, digit1 = np.divmod(index, 10)
+  field1, field2 = np.divmod(index, 18)
+  return (-90 + field2 * 10 + digit2 + .5, -180 + field1 * 20 + digit1 * 2 + 1.)
+
+@lru_cache(maxsize=4)
+def _sun_position(minute):
+  """Declination and longitude of the subsolar point, in radians"""
+  days = minute / 1440 - 10957.5           # days since J2000
+  anomaly = math.radians(357.529 + 0.98560028 * days)
+  mean_lon = 280.459 + 0.98564736 * days
+  ecl_lon = math.radians(mean_lon + 1.915 * math.sin(anomaly) + 0.020 * math.sin(2 * anomaly))
+  obliquity = math.radians(23.439 - 0.00000036 * days)
+  right_asc = math.atan2(math.cos(obliquity) * math.sin(ecl_lon), math.cos(ecl_lon))
+  declination = math.asin(math.sin(obliquity) * math.sin(ecl_lon))
+  gmst = (18.697374558 + 24.06570982441908 * days) % 24
+  return declination, right_asc - math.radians(gmst * 15)
+
+def sun_position(timestamp):
+  """The ephemeris is computed once per minute"""
+  return _sun_position(int(timestamp // 60))
+
+def solar_elevation(lat, lon, timestamp):
+  """Elevation of the sun in degrees, lat and lon can be numpy arrays"""
+  declination, sub_lon = sun_position(timestamp)
+  lat, lon = np.radians(lat), np.radians(lon)
+  sin_elev = (np.sin(lat) * math.sin(declination) +
+              np.cos(lat) * math.cos(declination) * np.cos(lon - sub_lon))
+  return np.degrees(np.arcsin(sin_elev))
+
+def grayline(elevation, center=-3, width=6):
+  """1 on the gray line, around the sunrise and sunset, decreasing to 0
+  in full day or night"""
+  return np.exp(-((elevation - center) / width) ** 2)
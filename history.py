@@ -0,0 +1,125 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+History of all the decodes.
+
+The history collection is the append-only record of every decode, in
+one bucket document per minute:
+
+  {_id: <minute timestamp>, v: <schema version>, n: <count>, d: [<decode>, ...]}
+
+The `calls` collection is only a view of the latest decode of each
+station, with the fields read by the transmit thread and the selectors,
+and the GeoJSON coordinates of its 2dsphere index (see VIEW_FIELDS).
+
+The decodes use short field names. The message text is kept, the fields
+that can be derived from the grid and the call (coordinates, distance,
+entity...) are not stored. The decodes are buffered and written with one
+update per bucket when the WSJT-X heartbeat arrives.
+
+  for decode in HistoryStore(db).find(call='W6BSD', start=time.time() - 86400):
+    print(decode['timestamp'], decode['SNR'])
+"""
+
+import logging
+
+from collections import defaultdict
+
+from pymongo import ASCENDING
+
+LOG = logging.getLogger('History')
+
+SCHEMA_VERSION = 2
+BUCKET_SIZE = 60
+MAX_PENDING = 2048
+
+# Schema version: ((short name, field name), ...)
+SCHEMAS = {
+  1: (('c', 'call'), ('to', 'to'), ('g', 'grid'), ('x', 'extra'), ('r', 'snr'), ('k', 'R73'),
+      ('s', 'SNR'), ('dt', 'DeltaTime'), ('df', 'DeltaFrequency'), ('m', 'Mode'), ('b', 'band')),
+  2: (('c', 'call'), ('to', 'to'), ('g', 'grid'), ('x', 'extra'), ('r', 'snr'), ('rp', 'R'),
+      ('k', 'R73'), ('s', 'SNR'), ('dt', 'DeltaTime'), ('df', 'DeltaFrequency'), ('m', 'Mode'),
+      ('t', 'Message'), ('b', 'band')),
+}
+
+# Fields of the latest decode of each station kept in the `calls` view
+VIEW_FIELDS = ('call', 'to', 'grid', 'timestamp', 'Time', 'SNR', 'DeltaTime', 'DeltaFrequency',
+               'Mode', 'Message', 'band', 'coordinates', 'distance', 'direction', 'entity',
+               'continent', 'cqzone')
+
+
+def compact(data, bucket):
+  """Compact decode, the timestamp becomes the offset `o` in the bucket"""
+  record = {short: data[name] for short, name in SCHEMAS[SCHEMA_VERSION]
+            if data.get(name) not in (None, '')}
+  record['o'] = data['timestamp'] - bucket
+  return record
+
+
+def view(data):
+  """Fields of the decode stored in the `calls` view"""
+  return {name: data[name] for name in VIEW_FIELDS if name in data}
+
+
+def expand(bucket):
+  """Generator returning the decodes of a bucket document with their full field names"""
+  fields = SCHEMAS[bucket.get('v', 1)]
+  for record in bucket['d']:
+    data = {name: record[short] for short, name in fields if short in record}
+    data['timestamp'] = bucket['_id'] + record.get('o', 0)
+    yield data
+
+
+class HistoryStore:
+
+  def __init__(self, db, collection='history'):
+    self.collection = db[collection]
+    self.pending = defaultdict(list)
+    self.count = 0
+
+  def create_indexes(self):
+    self.collection.create_index([('d.c', ASCENDING)])
+
+  def add(self, data):
+    bucket = data['timestamp'] - data['timestamp'] % BUCKET_SIZE
+    self.pending[bucket].append(compact(data, bucket))
+    self.count += 1
+    if self.count >= MAX_PENDING:
+      self.flush()
+
+  def flush(self):
+    pending, self.pending, self.count = self.pending, defaultdict(list), 0
+    for bucket, records in sorted(pending.items()):
+      self.collection.update_one({'_id': bucket}, {
+        '$setOnInsert': {'v': SCHEMA_VERSION},
+        '$push': {'d': {'$each': records}},
+        '$inc': {'n': len(records)},
+      }, upsert=True)
+    if pending:
+      LOG.debug('%d decodes written in %d buckets', sum(len(r) for r in pending.values()),
+                len(pending))
+
+  def find(self, call=None, start=None, end=None):
+    """Generator returning the decodes, filtered by call and time range"""
+    request = {}
+    if call:
+      request['d.c'] = call
+    if start is not None or end is not None:
+      request['_id'] = {}
+      if start is not None:
+        request['_id']['$gte'] = start - start % BUCKET_SIZE
+      if end is not None:
+        request['_id']['$lt'] = end
+    for bucket in self.collection.find(request, sort=[('_id', ASCENDING)]):
+      for data in expand(bucket):
+        if call and data.get('call') != call:
+          continue
+        if start is not None and data['timestamp'] < start:
+          continue
+        if end is not None and data['timestamp'] >= end:
+          continue
+        yield data
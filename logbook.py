@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Index of the stations already worked, by call, band and mode and by
+grid square and band. The index is loaded from the ADIF logbook set
+by `adif_file` and updated with the QSOs logged by WSJT-X.
+
+Usage: logbook.py logbook.adi
+  measure the time needed to load the logbook.
+"""
+
+import logging
+import mmap
+import os
+import re
+import sys
+import time
+
+from config import Config
+
+LOG = logging.getLogger('Logbook')
+
+# Only the fields used by the index are extracted from the ADIF records.
+# None of these fields can contain a "<", the value is then truncated to its length.
+RE_ADIF = re.compile(rb'<(CALL|BAND|MODE|SUBMODE|GRIDSQUARE|FREQ):(\d+)(?::\w)?>([^<]*)|<(EOR)>')
+
+CHUNK_SIZE = 1 << 22
+
+BANDS = (
+  (1.8, 2.0, '160m'), (3.5, 4.0, '80m'), (5.06, 5.45, '60m'), (7.0, 7.3, '40m'),
+  (10.1, 10.15, '30m'), (14.0, 14.35, '20m'), (18.068, 18.168, '17m'),
+  (21.0, 21.45, '15m'), (24.89, 24.99, '12m'), (28.0, 29.7, '10m'),
+  (50.0, 54.0, '6m'), (144.0, 148.0, '2m'),
+)
+
+# Mode symbols used by WSJT-X in the decode packets
+MODES = {'~': 'FT8', '+': 'FT4', '#': 'JT65', '@': 'JT9', '&': 'MSK144', '`': 'FST4', ':': 'Q65'}
+
+
+def band(frequency):
+  """Band name from a frequency in Hz"""
+  mhz = frequency / 1000000
+  for low, high, name in BANDS:
+    if low <= mhz <= high:
+      return name
+  return None
+
+
+def read_adif(buffer):
+  """Generator returning the ADIF records found in buffer as dictionaries.
+  The buffer is processed in chunks ending on a record boundary."""
+  record = {}
+  size = len(buffer)
+  start = 0
+  while start < size:
+    end = min(start + CHUNK_SIZE, size)
+    chunk = buffer[start:end].upper()
+    if end < size:
+      cut = chunk.rfind(b'<EOR>')
+      if cut > 0:
+        end = start + cut + 5
+        chunk = chunk[:cut + 5]
+    for field, length, value, eor in RE_ADIF.findall(chunk):
+      if eor:
+        if record:
+          yield record
+        record = {}
+      else:
+        record[field] = value[:int(length)]
+    start = end
+  if record:
+    yield record
+
+
+class WorkedBefore:
+  """Singleton loaded from the `adif_file` configuration key"""
+  _instance = None
+
+  def __new__(cls, *args, **kwargs):
+    if cls._instance is None:
+      cls._instance = super(WorkedBefore, cls).__new__(cls)
+      cls._instance.calls = None
+    return cls._instance
+
+  def __init__(self, filename=None):
+    if self.calls is not None:
+      return
+
+    self.calls = set()
+    self.grids = set()
+    filename = filename or Config().get('adif_file')
+    if not filename:
+      return
+    filename = os.path.expanduser(filename)
+    if not os.path.exists(filename):
+      LOG.warning('Logbook %s not found, no station worked before', filename)
+      return
+    self.load(filename)
+
+  def __len__(self):
+    return len(self.calls)
+
+  def load(self, filename):
+    start = time.perf_counter()
+    count = 0
+    with open(filename, 'rb') as fdin:
+      with mmap.mmap(fdin.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for record in read_adif(buffer):
+          self.add_record(record)
+          count += 1
+    LOG.info('%d QSOs loaded from %s in %.3fs', count, filename, time.perf_counter() - start)
+
+  def add_record(self, record):
+    if b'CALL' not in record:
+      return
+    if b'BAND' in record:
+      qso_band = record[b'BAND'].decode().lower()
+    else:
+      qso_band = band(float(record.get(b'FREQ', 0)) * 1000000)
+    mode = record.get(b'SUBMODE') or record.get(b'MODE', b'')
+    grid = record.get(b'GRIDSQUARE')
+    self.add(record[b'CALL'].decode(), qso_band, mode.decode(), grid and grid.decode())
+
+  def add_adif(self, adif):
+    """Add the QSO from the ADIF text sent by WSJT-X"""
+    for record in read_adif(adif.encode('utf-8')):
+      self.add_record(record)
+
+  def add(self, call, qso_band, mode, grid=None):
+    self.calls.add((call.upper(), qso_band, mode.upper()))
+    if grid:
+      self.grids.add((grid[:4].upper(), qso_band))
+
+  def is_new_call(self, call, qso_band, mode):
+    return (call, qso_band, mode) not in self.calls
+
+  def is_new_grid(self, grid, qso_band):
+    return (grid[:4], qso_band) not in self.grids
+
+
+def main():
+  logging.basicConfig(level=logging.INFO)
+  if len(sys.argv) != 2:
+    print(__doc__)
+    sys.exit(os.EX_USAGE)
+
+  worked = WorkedBefore(sys.argv[1])
+  print('{:,d} call/band/mode and {:,d} grid/band worked'.format(len(worked.calls),
+                                                                  len(worked.grids)))
+
+
+if __name__ == "__main__":
+  main()
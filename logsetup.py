@@ -0,0 +1,145 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Logging through a background thread.
+
+The handlers only queue the log records, the formatting and the I/O are
+done by a listener thread. The records whose arguments are immutable are
+formatted by the listener, the others are formatted when queued, so the
+message shows the state of the objects at the time of the call.
+
+Expensive payloads are wrapped in `Lazy`, they are only computed when
+the record is emitted:
+
+  LOG.info('Candidates: %s', Lazy(sorted, calls))
+
+The structured fields passed with `extra` (call, slot, stage, latency)
+are emitted as JSON keys when `log_format` is "json". The slot defaults
+to the slot of the record time:
+
+  LOG.info('Reply to %s', call, extra={'call': call, 'stage': 'reply'})
+
+Worker processes send their records to the parent process through the
+queue returned by `process_queue()`, see `worker_setup`.
+"""
+
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import time
+
+import timeline
+
+FIELDS = ('call', 'slot', 'stage', 'latency')
+TEXT_FORMAT = '%(name)s %(asctime)s %(levelname)s: %(funcName)s: %(message)s'
+
+_PROCESS_QUEUE = None
+
+
+class Lazy:
+  """Call func(*args) only when the value is formatted"""
+  __slots__ = ('func', 'args')
+
+  def __init__(self, func, *args):
+    self.func = func
+    self.args = args
+
+  def __str__(self):
+    return str(self.func(*self.args))
+
+  __repr__ = __str__
+
+
+_DEFERRED = (str, int, float, bool, type(None), Lazy)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+  def prepare(self, record):
+    if (record.exc_info or not isinstance(record.msg, str) or
+        not all(isinstance(arg, _DEFERRED) for arg in _args(record))):
+      return super().prepare(record)
+    return record
+
+
+def _args(record):
+  if isinstance(record.args, dict):
+    return record.args.values()
+  return record.args or ()
+
+
+class JSONFormatter(logging.Formatter):
+
+  def format(self, record):
+    data = {
+      't': round(record.created, 3),
+      'level': record.levelname,
+      'logger': record.name,
+      'thread': record.threadName,
+      'msg': record.getMessage(),
+    }
+    data['slot'] = timeline.slot_id(record.created)
+    for field in FIELDS:
+      if hasattr(record, field):
+        data[field] = getattr(record, field)
+    if record.exc_info:
+      data['exc'] = self.formatException(record.exc_info)
+    return json.dumps(data, default=str)
+
+
+def setup(level=logging.INFO, log_format='text'):
+  """Send the records of the root logger through a queue, return the
+  listener to stop at exit"""
+  if log_format == 'json':
+    formatter = JSONFormatter()
+  else:
+    formatter = logging.Formatter(TEXT_FORMAT, datefmt='%c')
+    formatter.converter = time.localtime
+  handler = logging.StreamHandler()
+  handler.setFormatter(formatter)
+
+  # Not used by the formats, saves time on every record
+  logging.logProcesses = False
+  logging.logMultiprocessing = False
+
+  log_queue = queue.SimpleQueue()
+  root = logging.getLogger()
+  for old in root.handlers[:]:
+    root.removeHandler(old)
+  root.addHandler(_QueueHandler(log_queue))
+  root.setLevel(level)
+  listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+  listener.start()
+  return listener
+
+
+class _Forward(logging.Handler):
+  """Log the records of the worker processes in this process"""
+
+  def emit(self, record):
+    logging.getLogger(record.name).handle(record)
+
+
+def process_queue():
+  """Queue receiving the records of the worker processes"""
+  global _PROCESS_QUEUE         # pylint: disable=global-statement
+  if _PROCESS_QUEUE is None:
+    _PROCESS_QUEUE = multiprocessing.Queue()
+    logging.handlers.QueueListener(_PROCESS_QUEUE, _Forward()).start()
+  return _PROCESS_QUEUE
+
+
+def worker_setup(log_queue, level):
+  """Replace the handlers inherited from the parent process, nothing
+  listens to their queue in the worker"""
+  root = logging.getLogger()
+  for old in root.handlers[:]:
+    root.removeHandler(old)
+  root.addHandler(logging.handlers.QueueHandler(log_queue))
+  root.setLevel(level)
@@ -0,0 +1,181 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Counters and latency histograms of the running sequencer.
+
+The buckets are allocated when the histogram is created. Recording a
+value is a bisect and an increment, no lock is taken: the GIL makes the
+increments safe enough for statistics.
+
+The metrics are rendered in the Prometheus text format, served over
+HTTP on the `metrics_port` and sent to the monitor clients asking for
+them with an SQ_METRICS packet.
+"""
+
+import bisect
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+LOG = logging.getLogger('Metrics')
+
+# Upper bounds in seconds, the last bucket counts the values above
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+REGISTRY = []
+
+
+def _labels(label, value, extra=''):
+  pairs = ['{}="{}"'.format(label, value)] if label else []
+  if extra:
+    pairs.append(extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+  def __init__(self, name=None, help_text='', label=None, values=()):
+    self.name = name
+    self.help = help_text
+    self.label = label
+    self.values = {value: 0 for value in values} if label else {None: 0}
+    if name:
+      REGISTRY.append(self)
+
+  def inc(self, value=None, amount=1):
+    self.values[value] = self.values.get(value, 0) + amount
+
+  def render(self):
+    lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+    for value, count in list(self.values.items()):
+      lines.append('{}{} {}'.format(self.name, _labels(self.label, value), count))
+    return lines
+
+
+class Histogram:
+
+  def __init__(self, name=None, help_text='', buckets=LATENCY_BUCKETS):
+    self.name = name
+    self.help = help_text
+    self.buckets = tuple(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.sum = 0.
+    self.count = 0
+    if name:
+      REGISTRY.append(self)
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def percentile(self, percent):
+    """Upper bound of the bucket containing the percentile"""
+    if not self.count:
+      return 0.
+    rank = self.count * percent / 100
+    total = 0
+    for idx, count in enumerate(self.counts):
+      total += count
+      if total >= rank:
+        return self.buckets[idx] if idx < len(self.buckets) else float('inf')
+    return float('inf')
+
+  def render(self):
+    lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+    lines.extend(self._samples(self.name, None, None))
+    return lines
+
+  def _samples(self, name, label, value):
+    lines = []
+    total = 0
+    for bound, count in zip(self.buckets + ('+Inf', ), self.counts):
+      total += count
+      lines.append('{}_bucket{} {}'.format(name, _labels(label, value, 'le="{}"'.format(bound)),
+                                           total))
+    lines.append('{}_sum{} {}'.format(name, _labels(label, value), self.sum))
+    lines.append('{}_count{} {}'.format(name, _labels(label, value), self.count))
+    return lines
+
+
+class HistogramFamily:
+  """Histograms sharing a name, one per label value"""
+
+  def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+    self.name = name
+    self.help = help_text
+    self.label = label
+    self.buckets = buckets
+    self.children = {}
+    REGISTRY.append(self)
+
+  def labels(self, value):
+    if value not in self.children:
+      self.children[value] = Histogram(buckets=self.buckets)
+    return self.children[value]
+
+  def render(self):
+    lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+    for value, histogram in list(self.children.items()):
+      lines.extend(histogram._samples(self.name, self.label, value))
+    return lines
+
+
+PACKET_TYPES = ('WSHeartbeat', 'WSStatus', 'WSDecode', 'WSClear', 'WSLogged', 'WSClose', 'WSADIF',
+                'invalid')
+
+DATAGRAMS = Counter('autoft_datagrams_total', 'WSJT-X datagrams received.', 'type', PACKET_TYPES)
+DROPPED = Counter('autoft_datagrams_dropped_total', 'WSJT-X datagrams dropped.', 'type',
+                  ('WSDecode', 'invalid'))
+PARSE_FAILURES = Counter('autoft_parse_failures_total', 'Decoded messages not understood.')
+STORE_LATENCY = Histogram('autoft_decode_store_seconds', 'Time from a decode to its storage.')
+DB_LATENCY = HistogramFamily('autoft_db_seconds', 'Database calls latency.', 'op')
+SELECTOR_LATENCY = Histogram('autoft_selector_seconds', 'Time to select a call.')
+REPLY_LATENCY = Histogram('autoft_reply_seconds', 'Time from the call decision to the reply.')
+MONITOR_MALFORMED = Counter('autoft_monitor_malformed_total', 'Malformed console packets.')
+NO_TRANSMIT = Counter('autoft_slots_no_transmit_total', 'Slots without transmission.', 'reason',
+                      ('pause', 'nocall'))
+
+
+def render():
+  lines = []
+  for metric in REGISTRY:
+    lines.extend(metric.render())
+  return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+  def do_GET(self):             # pylint: disable=invalid-name
+    if self.path.split('?')[0] != '/metrics':
+      self.send_error(404)
+      return
+    body = render().encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class MetricsServer(threading.Thread):
+  """Serve the metrics on http://<address>/metrics"""
+
+  def __init__(self, address):
+    super().__init__(daemon=True, name='Metrics')
+    self.server = HTTPServer(address, _Handler)
+
+  def run(self):
+    LOG.info('Metrics on http://%s:%d/metrics', *self.server.server_address[:2])
+    self.server.serve_forever()
+
+  def shutdown(self):
+    self.server.shutdown()
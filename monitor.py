@@ -11,6 +11,13 @@ import socket
 import threading
 import time
 
+import metrics
+import profiler
+import sqstatus
+import timeline
+
+from config import Config
+
 MAX_COUNTER = 7
 SEND_TIME = 5
 
@@ -18,13 +25,14 @@ LOG = logging.getLogger('Monitor')
 
 class Monitor(threading.Thread):
 
-  def __init__(self, ip_address, status, daemon=None):
+  def __init__(self, ip_address, store, daemon=None):
     assert isinstance(ip_address, (tuple, list)), "A tuple (ip, port) is expected"
     super().__init__(daemon=daemon)
     self._ip_address = ip_address
     self._clients = {}
-    self._status = status
+    self._store = store
     self._run_loop = True
+    self.profile_dir = Config().get('profile_dir', '.')
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -60,9 +68,32 @@ class Monitor(threading.Thread):
       if fd_in:
         for _fd in fd_in:
           data, ip_from = _fd.recvfrom(1024)
+          pkt_type = sqstatus.packet_type(data)
+          if pkt_type is None:
+            LOG.warning('Malformed packet from %s', ip_from)
+            metrics.MONITOR_MALFORMED.inc()
+            continue
+          if pkt_type == sqstatus.SQ_METRICS:
+            self.sock.sendto(sqstatus.metrics_packet(metrics.render()), ip_from)
+            continue
+          if pkt_type == sqstatus.SQ_PROFILE:
+            duration = sqstatus.SQStatus.profile_duration(data)
+            if duration is None:
+              LOG.warning('Truncated profile packet from %s', ip_from)
+              metrics.MONITOR_MALFORMED.inc()
+            else:
+              profiler.start(duration, self.profile_dir)
+            continue
+          try:
+            self._store.decode(data)
+          except IOError as err:
+            LOG.warning('%s from %s', err, ip_from)
+            metrics.MONITOR_MALFORMED.inc()
+            continue
           self.add_client(ip_from)
-          self._status.decode(data)
-          LOG.debug("%s", self._status)
+          if pkt_type != sqstatus.SQ_HEARTBEAT:
+            timeline.mark('monitor_command')
+          LOG.debug("%s", self._store.state)
           force_send = True
 
       now = int(time.time())
@@ -70,9 +101,10 @@ class Monitor(threading.Thread):
         force_send = False
         next_send = SEND_TIME + now
         LOG.debug('NB clients: %d', len(self._clients))
+        packet = self._store.encode()
         for client in self._clients:
           LOG.debug('Send to client %s', client)
-          self.sock.sendto(self._status.encode(), client)
+          self.sock.sendto(packet, client)
           self.update_client(client)
         self.purge_client()
     # exit
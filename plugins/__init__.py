@@ -5,18 +5,181 @@
 # All rights reserved.
 #
 
-from abc import ABC, abstractmethod
+import logging
+import time
+
+from abc import ABC
 from datetime import datetime
+from importlib import import_module
+
+import numpy as np
+
+import geo
+import logbook
+import stats
+
+from config import Config
+from contest import Contest
+
+LOG = logging.getLogger('plugins')
+
+
+class Snapshot:
+  """Columnar view of the CQ calls heard during the current slot.
+  Each column is a numpy array, the same index in every column
+  describes the same candidate."""
+
+  COLUMNS = (
+    ('call', 'U12', ''),
+    ('grid', 'U4', ''),
+    ('SNR', np.float32, 0),
+    ('distance', np.float32, 0),
+    ('direction', np.float32, 0),
+    ('DeltaTime', np.float32, 0),
+    ('DeltaFrequency', np.int32, 0),
+    ('black', np.bool_, False),
+    ('entity', 'U32', ''),
+    ('continent', 'U2', ''),
+    ('cqzone', np.int8, 0),
+    ('new_call', np.bool_, False),
+    ('new_grid', np.bool_, False),
+    ('dupe', np.bool_, False),
+    ('new_mult', np.bool_, False),
+    ('reply_rate', np.float32, 0),
+  )
+
+  def __init__(self, **columns):
+    for name, dtype, _ in self.COLUMNS:
+      setattr(self, name, np.asarray(columns[name], dtype=dtype))
+    self._square = None
+
+  def __len__(self):
+    return len(self.call)
+
+  def __repr__(self):
+    return "<{} {} calls>".format(self.__class__.__name__, len(self))
+
+  @property
+  def square(self):
+    """Index of the grid squares (see geo.square_index), -1 when invalid"""
+    if self._square is None:
+      codes = self.grid.view(np.uint32).reshape(-1, 4).astype(np.int32) - (65, 65, 48, 48)
+      valid = np.all((codes >= 0) & (codes < (18, 18, 10, 10)), axis=1)
+      index = ((codes[:, 0] * 18 + codes[:, 1]) * 10 + codes[:, 2]) * 10 + codes[:, 3]
+      self._square = np.where(valid, index, -1)
+    return self._square
+
+  @classmethod
+  def from_records(cls, records):
+    columns = {}
+    for name, _, default in cls.COLUMNS:
+      columns[name] = [obj.get(name, default) for obj in records]
+    return cls(**columns)
+
 
 class CallSelector(ABC):
+  """Selectors receive a Snapshot of the slot. They implement `score`,
+  returning a vector of scores, -inf excludes a candidate, or `select`
+  returning the index of the chosen candidate.
+  Old style selectors overriding `get` are still supported but cannot
+  run in a worker process."""
 
   def __init__(self, config, db):
     self.config = config.get(self.__class__.__name__)
     self.db = db
+    self.scores = None            # Scores of the last selection
 
-  @abstractmethod
   def get(self):
-    pass
+    records = self.fetch()
+    idx = self.select(Snapshot.from_records(records))
+    if idx is None:
+      return None
+    return records[idx]
+
+  def select(self, snapshot):
+    self.scores = None
+    if not len(snapshot):
+      return None
+    scores = np.where(snapshot.black, -np.inf, self.score(snapshot))
+    self.scores = scores
+    order = np.argsort(scores)[::-1]
+    if LOG.isEnabledFor(logging.DEBUG):
+      LOG.debug('%s: %s', self.__class__.__name__,
+                [(int(scores[i]), str(snapshot.call[i])) for i in order if scores[i] > -np.inf])
+    idx = int(order[0])
+    if scores[idx] == -np.inf:
+      return None
+    return idx
+
+  def score(self, snapshot):
+    return self.coefficient(snapshot.distance, snapshot.SNR)
+
+  def quick_mask(self, snapshot):      # pylint: disable=unused-argument
+    """Boolean vector of the candidates this selector can call, cheap to
+    compute. Used to pick a call when the selector overruns its budget,
+    None means no quick pick."""
+    return None
+
+  def grayline(self, snapshot, timestamp=None):
+    """Gray line score term, from 0 to 1, of both ends of the path"""
+    timestamp = timestamp or time.time()
+    here = geo.grid2latlon(Config().location)
+    lat, lon = geo.square_latlon(np.maximum(snapshot.square, 0))
+    there = geo.grayline(geo.solar_elevation(lat, lon, timestamp))
+    return there * geo.grayline(geo.solar_elevation(here[0], here[1], timestamp))
+
+  def fetch(self):
+    """Return the CQ calls of the current slot with their blacklist flag"""
+    records = list(self.db.calls.find({
+      "to": "CQ",
+      "timestamp": {"$gt": self.timestamp() - 15}
+    }))
+    index = {obj['call']: obj for obj in records}
+    for obj in self.db.black.find({"call": {"$in": list(index)}}, {"call": 1}):
+      index[obj['call']]['black'] = True
+    self.annotate(records)
+    return records
+
+  @classmethod
+  def annotate(cls, records, now=None):
+    """Add the worked before, contest and reply rate columns"""
+    cls.worked_before(records)
+    cls.contest(records)
+    cls.reply_rate(records, now)
+
+  @staticmethod
+  def worked_before(records):
+    worked = logbook.WorkedBefore()
+    for obj in records:
+      mode = logbook.MODES.get(obj.get('Mode'), obj.get('Mode', ''))
+      obj['new_call'] = worked.is_new_call(obj['call'], obj.get('band'), mode)
+      obj['new_grid'] = worked.is_new_grid(obj['grid'], obj.get('band'))
+
+  @staticmethod
+  def reply_rate(records, now=None):
+    reply_stats = stats.ReplyStats()
+    hour = datetime.utcfromtimestamp(now).hour if now else datetime.utcnow().hour
+    rates = reply_stats.rates([obj['direction'] for obj in records],
+                              [obj['grid'] for obj in records],
+                              [obj.get('band') for obj in records], hour, now)
+    for obj, rate in zip(records, rates):
+      obj['reply_rate'] = rate
+
+  @staticmethod
+  def contest(records):
+    state = Contest()
+    if not state:
+      return
+    for obj in records:
+      band = obj.get('band')
+      obj['dupe'] = state.is_dupe(obj['call'], band)
+      obj['new_mult'] = (state.is_new_grid(obj['grid'], band) or
+                         state.is_new_entity(obj.get('entity'), band))
+
+  @classmethod
+  def is_legacy(cls):
+    """Old style selector implementing its own `get`"""
+    return cls.get is not CallSelector.get
 
   @staticmethod
   def timestamp():
@@ -25,3 +188,11 @@ class CallSelector(ABC):
   @staticmethod
   def coefficient(distance, snr):
     return distance * 10**(snr/10)
+
+
+def get_class(name):
+  """Return the selector class from its name `<module.name>.<class>`"""
+  *module_name, class_name = name.split('.')
+  module_name = '.'.join(['plugins'] + module_name)
+  module = import_module(module_name)
+  return getattr(module, class_name)
@@ -0,0 +1,59 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+#
+
+import logging
+import os
+
+import numpy as np
+
+from . import CallSelector
+
+LOG = logging.getLogger('plugins.beam')
+
+BEAM_WIDTH = 30
+
+class Beam(CallSelector):
+  """Only consider the calls within ±width degrees of the beam heading.
+  The heading comes from the configuration or from a file containing
+  the heading in degrees, updated by the rotator software."""
+
+  def __init__(self, config, db):
+    super().__init__(config, db)
+    self.width = getattr(self.config, 'width', BEAM_WIDTH)
+    self._heading = getattr(self.config, 'heading', 0)
+    self.heading_file = getattr(self.config, 'heading_file', None)
+    if self.heading_file:
+      self.heading_file = os.path.expanduser(self.heading_file)
+    self._mtime = 0
+    LOG.info("%s: heading: %s, width: ±%d", self.__class__.__name__,
+             self.heading_file or self._heading, self.width)
+
+  @property
+  def heading(self):
+    if not self.heading_file:
+      return self._heading
+    try:
+      mtime = os.stat(self.heading_file).st_mtime
+      if mtime != self._mtime:
+        with open(self.heading_file, 'r') as fdin:
+          self._heading = float(fdin.read().strip()) % 360
+        self._mtime = mtime
+    except (IOError, ValueError) as err:
+      LOG.error('Heading file %s: %s', self.heading_file, err)
+    return self._heading
+
+  def mask(self, snapshot):
+    # The snapshot carries the direction, no process-local state is needed
+    delta = np.abs((snapshot.direction - self.heading + 180) % 360 - 180)
+    return delta <= self.width
+
+  def score(self, snapshot):
+    return np.where(self.mask(snapshot), super().score(snapshot), -np.inf)
+
+  def quick_mask(self, snapshot):
+    return self.mask(snapshot)
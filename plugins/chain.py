@@ -0,0 +1,105 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Chain of selectors evaluated over the same snapshot.
+
+When `select_method` is a list, the selectors are tried in order and the
+first one finding a call wins. When the entries carry a weight, the
+scores of all the selectors are combined instead.
+
+  select_method:
+    - grid.Grid
+    - grid.NotGrid
+    - any.Any
+
+  select_method:
+    - {method: grid.Grid, weight: 2}
+    - {method: any.Any, weight: 1}
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from logsetup import Lazy
+
+from . import CallSelector
+from . import get_class
+
+LOG = logging.getLogger('plugins.Chain')
+
+CHAIN_BUDGET = 1.5
+
+
+def _call_name(snapshot, idx):
+  return None if idx is None else str(snapshot.call[idx])
+
+
+class Chain(CallSelector):
+
+  def __init__(self, config, db):
+    super().__init__(config, db)
+    self.budget = config.get('selector_budget', CHAIN_BUDGET)
+    self.weighted = False
+    self.stages = []
+    for item in config.select_method:
+      if isinstance(item, dict):
+        name, weight = item['method'], item.get('weight')
+      else:
+        name, weight = item, None
+      klass = get_class(name)
+      if klass.is_legacy():
+        LOG.error('Selector %s overrides get() and cannot be chained', name)
+        continue
+      self.weighted |= weight is not None
+      self.stages.append((klass.__name__, 1 if weight is None else weight, klass(config, db)))
+    LOG.info('%s: %s', 'Weighted' if self.weighted else 'Ordered',
+             [(name, weight) for name, weight, _ in self.stages])
+
+  def select(self, snapshot):
+    if self.weighted:
+      return super().select(snapshot)
+
+    start = time.monotonic()
+    for name, _, stage in self.stages:
+      t_stage = time.monotonic()
+      idx = stage.select(snapshot)
+      self.scores = stage.scores
+      now = time.monotonic()
+      LOG.info('Stage %s: %s (%.1fms)', name, Lazy(_call_name, snapshot, idx),
+               (now - t_stage) * 1000, extra={'stage': name, 'latency': now - t_stage})
+      if idx is not None:
+        return idx
+      if now - start > self.budget:
+        LOG.warning('Chain out of time after %s: %.3fs', name, now - start)
+        break
+    return None
+
+  def score(self, snapshot):
+    total = np.zeros(len(snapshot))
+    keep = np.zeros(len(snapshot), dtype=bool)
+    for name, weight, stage in self.stages:
+      t_stage = time.monotonic()
+      scores = stage.score(snapshot)
+      valid = np.isfinite(scores)
+      total += np.where(valid, scores, 0) * weight
+      keep |= valid
+      elapsed = time.monotonic() - t_stage
+      LOG.info('Stage %s: %s candidates (%.1fms)', name, Lazy(np.count_nonzero, valid),
+               elapsed * 1000, extra={'stage': name, 'latency': elapsed})
+    return np.where(keep, total, -np.inf)
+
+  def quick_mask(self, snapshot):
+    """Candidates accepted by any stage, None if a stage has no quick mask"""
+    mask = np.zeros(len(snapshot), dtype=bool)
+    for _, _, stage in self.stages:
+      stage_mask = stage.quick_mask(snapshot)
+      if stage_mask is None:
+        return None
+      mask |= stage_mask
+    return mask
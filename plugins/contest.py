@@ -0,0 +1,39 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+#
+
+import logging
+
+import numpy as np
+
+import contest
+
+from . import CallSelector
+
+LOG = logging.getLogger('plugins.contest')
+
+MULT_BONUS = 10
+
+class Multiplier(CallSelector):
+  """Contest selector, skip the dupes and give a bonus to the new
+  multipliers (grid squares and entities) on the band.
+  Requires the `contest_file` configuration key."""
+
+  def __init__(self, config, db):
+    super().__init__(config, db)
+    self.bonus = getattr(self.config, 'bonus', MULT_BONUS)
+    if not contest.Contest():
+      LOG.error('%s: no contest state, set "contest_file" in the configuration',
+                self.__class__.__name__)
+    LOG.info("%s: multiplier bonus: %s", self.__class__.__name__, self.bonus)
+
+  def score(self, snapshot):
+    scores = super().score(snapshot) * np.where(snapshot.new_mult, self.bonus, 1)
+    return np.where(snapshot.dupe, -np.inf, scores)
+
+  def quick_mask(self, snapshot):
+    return ~snapshot.dupe
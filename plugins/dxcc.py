@@ -0,0 +1,55 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+#
+
+import logging
+
+import numpy as np
+
+import cty
+
+from . import CallSelector
+
+LOG = logging.getLogger('plugins.dxcc')
+
+class DXCCBase(CallSelector):
+  """The calls are resolved at ingest using the country file
+  configured with `cty_file`"""
+
+  def __init__(self, config, db):
+    super().__init__(config, db)
+    self.entities = list(getattr(self.config, 'entities', []))
+    self.continents = list(getattr(self.config, 'continents', []))
+    self.cqzones = list(getattr(self.config, 'cqzones', []))
+    if not cty.CountryFile():
+      LOG.error('%s: no country file, set "cty_file" in the configuration',
+                self.__class__.__name__)
+    LOG.info("%s: entities: %s, continents: %s, CQ zones: %s", self.__class__.__name__,
+             self.entities, self.continents, self.cqzones)
+
+  def mask(self, snapshot):
+    return (np.isin(snapshot.entity, self.entities) |
+            np.isin(snapshot.continent, self.continents) |
+            np.isin(snapshot.cqzone, self.cqzones))
+
+
+class DXCC(DXCCBase):
+
+  def score(self, snapshot):
+    return np.where(self.mask(snapshot), super().score(snapshot), -np.inf)
+
+  def quick_mask(self, snapshot):
+    return self.mask(snapshot)
+
+
+class NotDXCC(DXCCBase):
+
+  def score(self, snapshot):
+    return np.where(self.mask(snapshot), -np.inf, super().score(snapshot))
+
+  def quick_mask(self, snapshot):
+    return ~self.mask(snapshot)
@@ -0,0 +1,31 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+#
+
+import logging
+
+import numpy as np
+
+from . import CallSelector
+
+LOG = logging.getLogger('plugins.grayline')
+
+GRAYLINE_WEIGHT = 10
+
+class GrayLine(CallSelector):
+  """Favor the paths where both stations are close to the gray line"""
+
+  def __init__(self, config, db):
+    super().__init__(config, db)
+    self.weight = getattr(self.config, 'weight', GRAYLINE_WEIGHT)
+    LOG.info("%s: weight: %s", self.__class__.__name__, self.weight)
+
+  def score(self, snapshot):
+    return super().score(snapshot) * (1 + self.weight * self.grayline(snapshot))
+
+  def quick_mask(self, snapshot):
+    return np.ones(len(snapshot), dtype=bool)
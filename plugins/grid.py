@@ -7,65 +7,134 @@
 #
 
 import logging
-import operator
 import re
 
-from abc import abstractmethod
+import numpy as np
+
+import geo
 
 from . import CallSelector
 
 LOG = logging.getLogger('plugins.grid')
 
+RE_PREFIX = re.compile(r'^\^?((?:[A-Z0-9]|\[[A-Z0-9-]+\])+)$')
+RE_TOKEN = re.compile(r'[A-Z0-9]|\[[A-Z0-9-]+\]')
+
+
+def expand(pattern):
+  """Expand a simple pattern like `^[C-F][NM]` into the list of
+  prefixes it matches. Returns None if the pattern is a more complex
+  regular expression."""
+  match = RE_PREFIX.match(pattern)
+  if not match:
+    return None
+
+  prefixes = ['']
+  for token in RE_TOKEN.findall(match.group(1)):
+    chars = []
+    token = token.strip('[]')
+    while token:
+      if len(token) >= 3 and token[1] == '-':
+        chars.extend(chr(c) for c in range(ord(token[0]), ord(token[2]) + 1))
+        token = token[3:]
+      else:
+        chars.append(token[0])
+        token = token[1:]
+    prefixes = [p + c for p in prefixes for c in chars]
+    if len(prefixes) > geo.NB_SQUARES:
+      return None
+  return prefixes
+
+
+class PrefixTrie:
+  """Trie of literal prefixes"""
+
+  def __init__(self, prefixes=()):
+    self.root = {}
+    for prefix in prefixes:
+      self.add(prefix)
+
+  def add(self, prefix):
+    node = self.root
+    for char in prefix:
+      node = node.setdefault(char, {})
+    node[None] = True
+
+  def match(self, string):
+    """True if one of the prefixes starts the string"""
+    node = self.root
+    for char in string:
+      if None in node:
+        return True
+      node = node.get(char)
+      if node is None:
+        return False
+    return None in node
+
+
+class GridMatcher:
+  """Match the grid squares against the configured patterns.
+  The patterns are precomputed into a bitmap over all the 4 characters
+  squares. Other grids go through a prefix trie, and the regular
+  expressions that cannot be expanded into prefixes."""
+
+  def __init__(self, patterns):
+    self.trie = PrefixTrie()
+    regexps = []
+    for pattern in patterns:
+      prefixes = expand(pattern)
+      if prefixes is None:
+        regexps.append(f'(?:{pattern})')
+      else:
+        for prefix in prefixes:
+          self.trie.add(prefix)
+
+    self.regex = re.compile('|'.join(regexps)).match if regexps else lambda _: None
+    self.bitmap = np.fromiter((self.match(geo.index_square(idx)) for idx in range(geo.NB_SQUARES)),
+                              dtype=bool, count=geo.NB_SQUARES)
+
+  def match(self, grid):
+    return bool(self.trie.match(grid) or self.regex(grid))
+
+  def __contains__(self, grid):
+    index = geo.square_index(grid)
+    if index < 0:
+      return self.match(grid)
+    return bool(self.bitmap[index])
+
+  def mask(self, snapshot):
+    squares = snapshot.square
+    mask = self.bitmap[squares]
+    for idx in np.flatnonzero(squares < 0):
+      mask[idx] = self.match(snapshot.grid[idx])
+    return mask
+
+
 class GridBase(CallSelector):
 
   def __init__(self, config, db):
     super().__init__(config, db)
-    regexps = [f'(?:{r})' for r in self.config.squares]
-    self.match = re.compile('|'.join(regexps)).match
-    LOG.info("%s: %s", self.__class__.__name__, regexps)
+    self.matcher = GridMatcher(self.config.squares)
+    LOG.info("%s: %s (%d squares)", self.__class__.__name__, self.config.squares,
+             np.count_nonzero(self.matcher.bitmap))
 
-  @abstractmethod
-  def get(self):
-    pass
+  def mask(self, snapshot):
+    return self.matcher.mask(snapshot)
 
 
 class Grid(GridBase):
 
-  def get(self):
-    calls = []
-    req = self.db.calls.find({
-      "to": "CQ",
-      "timestamp": {"$gt": Grid.timestamp() - 15}
-    })
-    for obj in req.sort([('SNR', -1)]):
-      if self.match(obj['grid']):
-        coef = Grid.coefficient(obj['distance'], obj['SNR'])
-        calls.append((coef, obj))
-
-    calls.sort(key=operator.itemgetter(0), reverse=True)
-    LOG.info([(int(c[0]), c[1]['call']) for c in calls])
-    for _, call in calls:
-      if not self.db.black.count_documents({"call": call['call']}):
-        return call
-    return None
+  def score(self, snapshot):
+    return np.where(self.mask(snapshot), super().score(snapshot), -np.inf)
+
+  def quick_mask(self, snapshot):
+    return self.mask(snapshot)
 
 
 class NotGrid(GridBase):
 
-  def get(self):
-    calls = []
-    req = self.db.calls.find({
-      "to": "CQ",
-      "timestamp": {"$gt": NotGrid.timestamp() - 15}
-    })
-    for obj in req.sort([('SNR', -1)]):
-      if not self.match(obj['grid']):
-        coef = NotGrid.coefficient(obj['distance'], obj['SNR'])
-        calls.append((coef, obj))
-
-    calls.sort(key=operator.itemgetter(0), reverse=True)
-    LOG.info([(int(c[0]), c[1]['call']) for c in calls])
-    for _, call in calls:
-      if not self.db.black.count_documents({"call": call['call']}):
-        return call
-    return None
+  def score(self, snapshot):
+    return np.where(self.mask(snapshot), -np.inf, super().score(snapshot))
+
+  def quick_mask(self, snapshot):
+    return ~self.mask(snapshot)
@@ -0,0 +1,21 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+#
+
+import numpy as np
+
+from . import CallSelector
+
+class ReplyRate(CallSelector):
+  """Select the call with the best chances of answering us, from the
+  reply rate statistics by direction, grid field, band and hour."""
+
+  def score(self, snapshot):
+    return snapshot.reply_rate.astype(float)
+
+  def quick_mask(self, snapshot):
+    return np.ones(len(snapshot), dtype=bool)
@@ -0,0 +1,33 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+#
+
+import logging
+
+import numpy as np
+
+from . import CallSelector
+
+LOG = logging.getLogger('plugins.worked')
+
+GRID_BONUS = 10
+
+class NewOne(CallSelector):
+  """Only call the stations not worked before on this band and mode.
+  The new grid squares get a bonus."""
+
+  def __init__(self, config, db):
+    super().__init__(config, db)
+    self.grid_bonus = getattr(self.config, 'grid_bonus', GRID_BONUS)
+    LOG.info("%s: grid bonus: %s", self.__class__.__name__, self.grid_bonus)
+
+  def score(self, snapshot):
+    scores = super().score(snapshot) * np.where(snapshot.new_grid, self.grid_bonus, 1)
+    return np.where(snapshot.new_call, scores, -np.inf)
+
+  def quick_mask(self, snapshot):
+    return snapshot.new_call
@@ -0,0 +1,93 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Sampling profiler of the running sequencer.
+
+A background thread samples the stacks of all the threads every
+SAMPLE_INTERVAL seconds, for the requested duration. The samples are
+written in the collapsed stacks format, one line per distinct stack with
+its count, ready for flamegraph.pl or speedscope:
+
+  MainThread;sequencer.py:main;sequencer.py:process;... 42
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+
+LOG = logging.getLogger('Profiler')
+
+SAMPLE_INTERVAL = .01
+MAX_DURATION = 600
+
+_LOCK = threading.Lock()
+_PROFILER = None
+
+
+def _frame_name(frame):
+  code = frame.f_code
+  return '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+
+
+class Profiler(threading.Thread):
+
+  def __init__(self, duration, filename):
+    super().__init__(daemon=True, name='Profiler')
+    self.duration = min(duration, MAX_DURATION)
+    self.filename = filename
+    self.samples = Counter()
+    self._done = threading.Event()
+
+  def stop(self):
+    self._done.set()
+
+  def run(self):
+    LOG.info('Profiling for %ds', self.duration)
+    own = threading.get_ident()
+    end = time.monotonic() + self.duration
+    while time.monotonic() < end and not self._done.is_set():
+      names = {thread.ident: thread.name for thread in threading.enumerate()}
+      for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+        if ident == own:
+          continue
+        stack = []
+        while frame is not None:
+          stack.append(_frame_name(frame))
+          frame = frame.f_back
+        stack.append(names.get(ident, str(ident)))
+        self.samples[';'.join(reversed(stack))] += 1
+      self._done.wait(SAMPLE_INTERVAL)
+    self.save()
+
+  def save(self):
+    with open(self.filename, 'w') as fdout:
+      for stack, count in self.samples.most_common():
+        fdout.write('{} {}\n'.format(stack, count))
+    LOG.info('Profile, %d samples, written to %s', sum(self.samples.values()), self.filename)
+
+
+def start(duration, directory='.'):
+  """Start profiling for `duration` seconds, a duration of 0 stops the
+  running profiler"""
+  global _PROFILER              # pylint: disable=global-statement
+  with _LOCK:
+    if _PROFILER and _PROFILER.is_alive():
+      _PROFILER.stop()
+      if not duration:
+        return None
+      _PROFILER.join()
+    if not duration:
+      return None
+    filename = os.path.join(os.path.expanduser(directory),
+                            time.strftime('autoft-%Y%m%d-%H%M%S.folded', time.gmtime()))
+    _PROFILER = Profiler(duration, filename)
+    _PROFILER.start()
+    return filename
@@ -0,0 +1,150 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Activity rollups maintained as the decodes arrive.
+
+For each band and hour of the day, fixed size arrays count the decodes,
+the CQs, the unique stations, the sum of the SNRs and the replies to our
+call, by continent and by grid field. The arrays cover the last 24
+hours. When the time moves forward, the slices of the hours started
+since the last decode are cleared, including the hours without decodes.
+
+The current hour is saved in the `activity` collection, one document per
+hour and band, every time the WSJT-X heartbeat arrives:
+
+  {_id: "<hour timestamp>:<band>", hour: <hour timestamp>, band: "20m",
+   continent: {"EU": [decodes, cq, unique, snr, replies], ...},
+   field: {"JN": [decodes, cq, unique, snr, replies], ...}}
+"""
+
+import logging
+import time
+
+import numpy as np
+
+import geo
+import stats
+
+from config import Config
+
+LOG = logging.getLogger('Rollup')
+
+CONTINENTS = ('AF', 'AN', 'AS', 'EU', 'NA', 'OC', 'SA')
+METRICS = ('decodes', 'cq', 'unique', 'snr', 'replies')
+NB_FIELDS = 18 * 18
+NB_BANDS = len(stats.BAND_NAMES) + 1
+
+
+def field_name(index):
+  return chr(65 + index // 18) + chr(65 + index % 18)
+
+
+class Activity:
+  """Singleton"""
+  _instance = None
+
+  def __new__(cls, *args, **kwargs):
+    if cls._instance is None:
+      cls._instance = super(Activity, cls).__new__(cls)
+      cls._instance.continents = None
+    return cls._instance
+
+  def __init__(self):
+    if self.continents is not None:
+      return
+
+    # The last continent and field are the unknown ones
+    self.continents = np.zeros((NB_BANDS, 24, len(CONTINENTS) + 1, len(METRICS)))
+    self.fields = np.zeros((NB_BANDS, 24, NB_FIELDS + 1, len(METRICS)))
+    self.my_call = Config().get('call')
+    self._hour = None
+    self._seen = set()
+    self._dirty = set()
+
+  def add(self, data):
+    hour = data['timestamp'] // 3600
+    if hour != self._hour:
+      self.advance(hour)
+    band = data.get('band')
+    band = stats.BAND_NAMES.index(band) if band in stats.BAND_NAMES else NB_BANDS - 1
+    continent = data.get('continent')
+    continent = CONTINENTS.index(continent) if continent in CONTINENTS else len(CONTINENTS)
+    field = geo.square_index(data['grid']) // 100 if data.get('grid') else -1
+    field = field if field >= 0 else NB_FIELDS
+
+    values = np.zeros(len(METRICS))
+    values[0] = 1
+    values[1] = data.get('to') == 'CQ'
+    values[2] = (band, data['call']) not in self._seen
+    values[3] = data.get('SNR', 0)
+    values[4] = data.get('to') == self.my_call
+    self._seen.add((band, data['call']))
+    hour = hour % 24
+    self.continents[band, hour, continent] += values
+    self.fields[band, hour, field] += values
+    self._dirty.add(band)
+
+  def advance(self, hour):
+    """Clear the slices of the hours started after the current one"""
+    if self._hour is not None and hour <= self._hour:
+      return
+    first = hour - 23 if self._hour is None else max(self._hour + 1, hour - 23)
+    for idx in range(first, hour + 1):
+      self.continents[:, idx % 24] = 0
+      self.fields[:, idx % 24] = 0
+    self._seen.clear()
+    self._hour = hour
+
+  def get_state(self):
+    return {'continents': self.continents, 'fields': self.fields, 'hour': self._hour,
+            'seen': self._seen}
+
+  def set_state(self, state):
+    if (state['continents'].shape != self.continents.shape or
+        state['fields'].shape != self.fields.shape):
+      LOG.warning('Activity dimensions changed, snapshot ignored')
+      return
+    self.continents = state['continents']
+    self.fields = state['fields']
+    self._hour = state['hour']
+    self._seen = state['seen']
+
+  def query(self, band, hour=None, continent=None, field=None):
+    """Metrics of a band and hour of the day, for a continent or a field,
+    or for all the stations. The snr is the mean SNR."""
+    self.advance(int(time.time()) // 3600)
+    if hour is None:
+      hour = time.gmtime().tm_hour
+    band = stats.BAND_NAMES.index(band) if band in stats.BAND_NAMES else NB_BANDS - 1
+    if continent is not None:
+      counts = self.continents[band, hour % 24, CONTINENTS.index(continent)]
+    elif field is not None:
+      counts = self.fields[band, hour % 24, geo.square_index(field[:2] + '00') // 100]
+    else:
+      counts = self.continents[band, hour % 24].sum(axis=0)
+    result = dict(zip(METRICS, counts.tolist()))
+    result['snr'] = result['snr'] / result['decodes'] if result['decodes'] else 0
+    return result
+
+  def flush(self, db):
+    """Save the current hour of the bands updated since the last flush"""
+    if not self._dirty:
+      return
+    stamp = self._hour * 3600
+    hour = self._hour % 24
+    for band in self._dirty:
+      name = stats.BAND_NAMES[band] if band < len(stats.BAND_NAMES) else 'other'
+      document = {'hour': stamp, 'band': name, 'continent': {}, 'field': {}}
+      for idx in np.flatnonzero(self.continents[band, hour, :, 0]):
+        key = CONTINENTS[idx] if idx < len(CONTINENTS) else 'other'
+        document['continent'][key] = self.continents[band, hour, idx].tolist()
+      for idx in np.flatnonzero(self.fields[band, hour, :, 0]):
+        key = field_name(idx) if idx < NB_FIELDS else 'other'
+        document['field'][key] = self.fields[band, hour, idx].tolist()
+      db.activity.update_one({'_id': '{}:{}'.format(stamp, name)}, {'$set': document},
+                             upsert=True)
+    self._dirty.clear()
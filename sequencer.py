@@ -6,19 +6,35 @@
 # All rights reserved.
 #
 import logging
+import os
 import re
 import select
+import signal
 import socket
 import sys
 import threading
 import time
 
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import GEOSPHERE
+from pymongo.errors import OperationFailure
 
+import contest
+import cty
+import dedup
 import geo
+import history
+import logbook
+import logsetup
+import metrics
 import monitor
-import sqstatus
+import rollup
+import spatial
+import state
+import stats
+import storage
+import timeline
+import warmstart
 import wsjtx
 
 from config import Config
@@ -27,14 +43,22 @@ from transmit import Transmit
 RE_EXCHANGES = {
   "CQ": re.compile(r'^(?P<to>CQ) ((?P<extra>.*) |)(?P<call>\w+)(|/\w+) (?P<grid>[A-Z]{2}[0-9]{2})'),
   "REPLY": re.compile(r'^(?P<to>\w+)(|/\w+) (?P<call>\w+)(|/\w+) (?P<grid>[A-Z]{2}[0-9]{2})'),
-  "SNR": re.compile(r'^(?P<to>\w+)(|/\w+) (?P<call>\w+)(|/\w+) (?:R|)(?P<snr>(0|[-+]\d+))'),
+  "SNR": re.compile(r'^(?P<to>\w+)(|/\w+) (?P<call>\w+)(|/\w+) (?P<R>R|)(?P<snr>(0|[-+]\d+))'),
   "R73": re.compile(r'^(?P<to>\w+)(|/\w+) (?P<call>\w+)(|/\w+) (?P<R73>(RRR|R*73))'),
 }
 
-STATUS = sqstatus.SQStatus()
+START_TIME = time.monotonic()
+
+STATE = state.StateStore()
+DB = None
+DEDUP = dedup.DecodeFilter()
+HISTORY = None
+WARM = None
+WS_DECODING = False
 
 def geoloc(lat, lon):
-  return {"type": "Point", "coordinates" : [lat, lon]}
+  # GeoJSON coordinates are [longitude, latitude]
+  return {"type": "Point", "coordinates" : [lon, lat]}
 
 def parse_packet(packet):
   """Save the traffic in the database"""
@@ -46,13 +70,22 @@ def parse_packet(packet):
       break
 
   if not match:
-    logging.error('Cannot parse message "%s"', packet.Message)
+    logging.error('Cannot parse message "%s"', packet.Message, extra={'stage': 'ingest'})
     return None
 
   data = match.groupdict().copy()
   data['timestamp'] = Transmit.timestamp()
   data.update(packet.as_dict())
   exchange = type('EXCHANGE', (object, ), match.groupdict())
+  extra = {'call': exchange.call, 'stage': 'ingest'}
+
+  countries = cty.CountryFile()
+  if countries:
+    entity = countries.lookup(exchange.call)
+    if entity:
+      data['entity'] = entity.name
+      data['continent'] = entity.continent
+      data['cqzone'] = entity.cqzone
 
   if ex_type == 'CQ' or ex_type == 'REPLY':
     try:
@@ -60,50 +93,90 @@ def parse_packet(packet):
       dist = geo.distance(here, (lat, lon))
       direction = geo.azimuth(here, (lat, lon))
     except (ValueError, AssertionError) as err:
-      logging.error("%s, %s", packet.Message, err)
+      logging.error("%s, %s", packet.Message, err, extra=extra)
       return None
     data['coordinates'] = geoloc(lat, lon)
     data['distance'] = dist
     data['direction'] = direction
+    spatial.RecentStations().add(exchange.call, direction, dist)
     logging.debug("From: %-7s To: %-7s - %s Dist: %6d Dir: %3d SNR: % 6.2f ΔTime: %1.2f",
                   exchange.call, exchange.to, exchange.grid, dist, direction,
-                  packet.SNR, packet.DeltaTime)
+                  packet.SNR, packet.DeltaTime, extra=extra)
   elif ex_type == "SNR":
     logging.debug("From: %-7s To: %-7s - %s: %4d - SNR: % 6.2f ΔTime % 1.2f",
                     exchange.call, exchange.to, ex_type, int(exchange.snr), packet.SNR,
-                    packet.DeltaTime)
+                    packet.DeltaTime, extra=extra)
   elif ex_type == "R73":
     logging.debug('From: %-7s To: %-7s  %s - SNR: % 6.3f',
-                 exchange.call, exchange.to, exchange.R73, packet.SNR)
+                 exchange.call, exchange.to, exchange.R73, packet.SNR, extra=extra)
 
   return data
 
 
 def process_wsjt(data, ip_from):
+  global WS_DECODING
+  start = time.perf_counter()
   try:
     packet = wsjtx.ft8_decode(data)
     logging.debug(packet)
   except (IOError, NotImplementedError) as err:
+    metrics.DATAGRAMS.inc('invalid')
+    metrics.DROPPED.inc('invalid')
     logging.error(err)
     return
+  metrics.DATAGRAMS.inc(packet.__class__.__name__)
 
   if isinstance(packet, wsjtx.WSHeartbeat):
-    STATUS.ip_wsjt = ip_from
+    STATE.update(ip_wsjt=ip_from)
+    spatial.RecentStations().expire()
+    DB.expire()
+    DEDUP.log()
+    if HISTORY:
+      HISTORY.flush()
+    rollup.Activity().flush(DB)
+    if WARM:
+      WARM.autosave()
   elif isinstance(packet, wsjtx.WSStatus):
-    pass
+    STATE.update(band=logbook.band(packet.Frequency))
+    if WS_DECODING and not packet.Decoding:
+      timeline.mark('decoding_done')
+    WS_DECODING = packet.Decoding
+    if packet.TXEnabled:
+      timeline.mark('tx_enabled', first=True)
+    if packet.Transmitting:
+      timeline.mark('transmitting', first=True)
   elif isinstance(packet, wsjtx.WSDecode):
+    timeline.mark('first_decode', first=True)
+    timeline.mark('last_decode')
+    if not DEDUP.accept(packet):
+      metrics.DROPPED.inc(packet.__class__.__name__)
+      return
     data = parse_packet(packet)
     if not data:
+      metrics.PARSE_FAILURES.inc()
       return
-    STATUS.db.calls.update_one({'call': data['call']},
-                               {"$set": data},
-                               upsert=True)
+    data['band'] = STATE.state.band
+    if data['to'] == Config().call:
+      stats.ReplyStats().replied(data['call'])
+    DB.calls.update_one({'call': data['call']},
+                        {"$set": history.view(data)},
+                        upsert=True)
+    if HISTORY:
+      HISTORY.add(data)
+    rollup.Activity().add(data)
+    metrics.STORE_LATENCY.observe(time.perf_counter() - start)
   elif isinstance(packet, wsjtx.WSLogged):
-    STATUS.db.black.update_one({"call": packet.DXCall},
-                               {"$set": {"time": Transmit.timestamp(), "logged": True}},
-                               upsert=True)
-    STATUS.call = ''
-    STATUS.xmit = 0
+    DB.black.update_one({"call": packet.DXCall},
+                        {"$set": {"time": Transmit.timestamp(), "logged": True}},
+                        upsert=True)
+    band = logbook.band(packet.DialFrequency)
+    logbook.WorkedBefore().add(packet.DXCall, band, packet.Mode, packet.DXGrid)
+    if contest.Contest():
+      entity = cty.CountryFile().lookup(packet.DXCall) if cty.CountryFile() else None
+      contest.Contest().log(packet.DXCall, band, packet.DXGrid, entity and entity.name)
+    STATE.update(call='', xmit=0)
+  elif isinstance(packet, wsjtx.WSADIF):
+    logbook.WorkedBefore().add_adif(packet.ADIF)
   else:
     logging.warning(packet)
 
@@ -119,15 +192,40 @@ def process(sock):
       process_wsjt(data, ip_from)
 
 
+def dump_timeline(_signum, _frame):
+  timeline.chrome_trace(os.path.expanduser(Config().get('timeline_file', 'timeline.json')))
+
+
 def main():
+  global DB, HISTORY, WARM
   logging.info('Starting auto ham')
   config = Config()
 
-  STATUS.db = MongoClient(config.mongo_server).wsjt
+  DB = storage.Storage(config.mongo_server,
+                       timeout=config.get('mongo_timeout', storage.DB_TIMEOUT))
+  DB.calls.create_index('timestamp')
+  try:
+    DB.calls.create_index([('coordinates', GEOSPHERE)])
+  except OperationFailure as err:
+    logging.warning('2dsphere index: %s. Old records store the coordinates as [lat, lon], '
+                    'purge the calls collection', err)
+  if config.get('history', True):
+    HISTORY = history.HistoryStore(DB)
+    HISTORY.create_indexes()
+  cty.CountryFile()
+  logbook.WorkedBefore()
+  contest.Contest()
+  stats.ReplyStats()
+  rollup.Activity()
   try:
-    STATUS.max_tries = config.max_tries
+    STATE.set_max_tries(config.max_tries)
   except AttributeError:
     pass
+  if config.get('snapshot_file'):
+    WARM = warmstart.WarmStart(config.snapshot_file, STATE)
+    WARM.restore(DB)
+
+  signal.signal(signal.SIGUSR1, dump_timeline)
 
   # WSJT-X server channel
   sock_wsjt = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -141,15 +239,24 @@ def main():
   logging.info('Monitor IP: %s, Port: %d', bind_addr, config.monitor_port)
 
   try:
-    #    xmit_thread = Transmit(STATUS, range(0, 60, 15), daemon=True)
-    xmit_thread = Transmit(STATUS, range(14, 60, 15), daemon=True)
+    #    xmit_thread = Transmit(STATE, DB, range(0, 60, 15), daemon=True)
+    xmit_thread = Transmit(STATE, DB, range(14, 60, 15), daemon=True)
+    xmit_thread.warmup()
     xmit_thread.start()
-    sqmonitor = monitor.Monitor((bind_addr, config.monitor_port), STATUS, daemon=True)
+    sqmonitor = monitor.Monitor((bind_addr, config.monitor_port), STATE, daemon=True)
     sqmonitor.start()
+    if config.get('metrics_port'):
+      metrics.MetricsServer((bind_addr, config.metrics_port)).start()
+    logging.info('Ready to transmit in %.3fs', time.monotonic() - START_TIME)
     process(sock_wsjt)
     time.sleep(300)
   except KeyboardInterrupt:
     logging.info("Shutting down")
+    stats.ReplyStats().save()
+    if WARM:
+      WARM.save()
+    if HISTORY:
+      HISTORY.flush()
     xmit_thread.shutdown()
     xmit_thread.join()
     sqmonitor.shutdown()
@@ -157,6 +264,8 @@ def main():
     sock_wsjt.close()
 
 if __name__ == "__main__":
-  logging.basicConfig(format='%(name)s %(asctime)s %(levelname)s: %(funcName)s: %(message)s',
-                      datefmt='%c', level=logging.INFO)
-  main()
+  LISTENER = logsetup.setup(logging.INFO, Config().get('log_format', 'text'))
+  try:
+    main()
+  finally:
+    LISTENER.stop()
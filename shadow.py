@@ -0,0 +1,70 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Shadow selectors see the same snapshot as the live selector but never
+transmit. They run in a worker thread once the reply has been sent, their
+decisions and latency are appended to their own decision log.
+"""
+
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import plugins
+
+from decisionlog import DecisionLog
+
+LOG = logging.getLogger('Shadow')
+
+SHADOW_FILE = 'shadow.jsonl'
+
+
+class Shadow:
+
+  def __init__(self, config, db):
+    self.selectors = []
+    for name in config.get('shadow_methods', []):
+      klass = plugins.get_class(name)
+      if klass.is_legacy():
+        LOG.error('Selector %s overrides get() and cannot run in shadow mode', name)
+        continue
+      self.selectors.append((name, klass(config, db)))
+    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Shadow')
+    self.log = DecisionLog(config.get('shadow_file', SHADOW_FILE))
+    if self.selectors:
+      LOG.info('Shadow selectors: %s', [name for name, _ in self.selectors])
+      self.log.start()
+
+  def __bool__(self):
+    return bool(self.selectors)
+
+  def submit(self, snapshot, live_call):
+    if not self.selectors or snapshot is None:
+      return
+    self._pool.submit(self._run, snapshot, live_call)
+
+  def _run(self, snapshot, live_call):
+    slot = int(time.time())
+    for name, selector in self.selectors:
+      start = time.perf_counter()
+      try:
+        idx = selector.select(snapshot)
+      except Exception:         # pylint: disable=broad-except
+        LOG.exception('Shadow selector %s failed', name)
+        continue
+      latency = time.perf_counter() - start
+      self.log.write({
+        't': slot, 'sel': name, 'n': len(snapshot), 'live': live_call,
+        'call': None if idx is None else str(snapshot.call[idx]),
+        'ms': round(latency * 1000, 3),
+      })
+
+  def shutdown(self):
+    self._pool.shutdown(wait=False)
+    if self.selectors:
+      self.log.shutdown()
@@ -0,0 +1,95 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+In memory index of the stations heard recently, sorted by azimuth and by
+great circle distance. Range queries are O(log n) plus the number of
+stations returned.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+LOG = logging.getLogger('Spatial')
+
+RECENT_TIME = 60                # Seconds a station stays in the index
+
+
+class RecentStations:
+  """Singleton fed by the decodes carrying a grid square"""
+  _instance = None
+
+  def __new__(cls, *args, **kwargs):
+    if cls._instance is None:
+      cls._instance = super(RecentStations, cls).__new__(cls)
+      cls._instance.stations = None
+    return cls._instance
+
+  def __init__(self, recent_time=RECENT_TIME):
+    if self.stations is not None:
+      return
+    self.recent_time = recent_time
+    self.stations = {}          # call -> (azimuth, distance, timestamp)
+    self.by_azimuth = []        # sorted (azimuth, call)
+    self.by_distance = []       # sorted (distance, call)
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.stations)
+
+  def add(self, call, azimuth, distance, timestamp=None):
+    timestamp = timestamp or time.time()
+    with self._lock:
+      self._remove(call)
+      self.stations[call] = (azimuth, distance, timestamp)
+      bisect.insort(self.by_azimuth, (azimuth, call))
+      bisect.insort(self.by_distance, (distance, call))
+
+  def _remove(self, call):
+    if call not in self.stations:
+      return
+    azimuth, distance, _ = self.stations.pop(call)
+    del self.by_azimuth[bisect.bisect_left(self.by_azimuth, (azimuth, call))]
+    del self.by_distance[bisect.bisect_left(self.by_distance, (distance, call))]
+
+  def expire(self, now=None):
+    limit = (now or time.time()) - self.recent_time
+    with self._lock:
+      for call in [c for c, (_, _, ts) in self.stations.items() if ts < limit]:
+        self._remove(call)
+
+  def get_state(self):
+    with self._lock:
+      return dict(self.stations)
+
+  def set_state(self, stations):
+    for call, (azimuth, distance, timestamp) in stations.items():
+      self.add(call, azimuth, distance, timestamp)
+    self.expire()
+
+  def sector(self, heading, width):
+    """Calls heard within ±width degrees of heading"""
+    low, high = (heading - width) % 360, (heading + width) % 360
+    with self._lock:
+      if width >= 180:
+        return [call for _, call in self.by_azimuth]
+      if low <= high:
+        return self._range(self.by_azimuth, low, high)
+      return (self._range(self.by_azimuth, low, 360) +
+              self._range(self.by_azimuth, 0, high))
+
+  def ring(self, min_distance, max_distance):
+    """Calls heard between min_distance and max_distance km"""
+    with self._lock:
+      return self._range(self.by_distance, min_distance, max_distance)
+
+  @staticmethod
+  def _range(index, low, high):
+    start = bisect.bisect_left(index, (low, ''))
+    end = bisect.bisect_right(index, (high, '\uffff'))
+    return [call for _, call in index[start:end]]
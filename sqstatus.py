@@ -15,7 +15,52 @@ SQ_STRUCT = struct.Struct('!IHHHH??10s')
 
 SQ_HEARTBEAT = 0x01
 SQ_PAUSE = 0x02
+SQ_PROFILE = 0x04
 SQ_DATA = 0x08
+SQ_METRICS = 0x10
+
+SQ_HEADER = struct.Struct('!IHH')
+SQ_PAUSE_STRUCT = struct.Struct('!IHH?')
+
+
+def packet_type(packet):
+  """Type of a console packet, None when the packet is malformed"""
+  if len(packet) < SQ_HEADER.size:
+    return None
+  magic, _, pkt_type = SQ_HEADER.unpack_from(packet)
+  return pkt_type if magic == SQ_MAGIC else None
+
+
+def data_packet(max_tries, xmit, pause, shutdown, call):
+  return SQ_STRUCT.pack(SQ_MAGIC, SQ_VERSION, SQ_DATA, max_tries, xmit, pause, shutdown,
+                        call.encode('utf-8'))
+
+
+def metrics_packet(text=''):
+  """Without text, a metrics request. The response carries the metrics
+  in the Prometheus text format"""
+  return SQ_HEADER.pack(SQ_MAGIC, SQ_VERSION, SQ_METRICS) + text.encode('utf-8')
+
+
+def parse(packet):
+  """Return the packet type and the fields of a pause or a data packet"""
+  packet = packet[:SQ_STRUCT.size].ljust(SQ_STRUCT.size, b'\0')
+  magic, version, pkt_type = SQ_HEADER.unpack_from(packet)
+  if magic != SQ_MAGIC or version < SQ_VERSION:
+    raise IOError("SQS packet error")
+
+  if pkt_type == SQ_PAUSE:
+    return pkt_type, {'pause': SQ_PAUSE_STRUCT.unpack_from(packet)[3]}
+  if pkt_type == SQ_DATA:
+    _, _, _, max_tries, xmit, pause, shutdown, call = SQ_STRUCT.unpack_from(packet)
+    try:
+      call = call.rstrip(b'\0').decode('utf-8')
+    except UnicodeDecodeError as err:
+      raise IOError("SQS packet error, call: {}".format(err)) from None
+    return pkt_type, {'max_tries': max_tries, 'xmit': xmit, 'pause': pause,
+                      'shutdown': shutdown, 'call': call}
+  return pkt_type, {}
+
 
 XMIT_MAXRETRY = 5
 
@@ -45,10 +90,6 @@ class SQStatus:
     self._pause = False
     self._shutdown = False
 
-    # Local variables
-    self._ip_wsjt = None
-    self._ip_monit = None
-
   def __repr__(self):
     msg = ("{0.__class__} Xmit:{0.xmit} Max_Tries: {0._max_tries} "
            "Call: {0.call} Pause: {0._pause}")
@@ -64,45 +105,33 @@ class SQStatus:
     self.__xmit__ = 0
     self._call = b''
     self._pause = flag
-    sq_struct = struct.Struct('!IHH?')
-    packet = ctypes.create_string_buffer(sq_struct.size)
-    sq_struct.pack_into(packet, 0, SQ_MAGIC, SQ_VERSION, SQ_PAUSE, flag)
-    return packet.raw
+    return SQ_PAUSE_STRUCT.pack(SQ_MAGIC, SQ_VERSION, SQ_PAUSE, flag)
 
-  def encode(self):
-    packet = ctypes.create_string_buffer(SQ_STRUCT.size)
-    SQ_STRUCT.pack_into(packet, 0, SQ_MAGIC, SQ_VERSION, SQ_DATA, self._max_tries,
-                        self.xmit, self._pause, self._shutdown, self._call)
-    return packet.raw
-
-  def decode(self, packet):
-    sq_header = struct.Struct('!IHH')
-    buffer = ctypes.create_string_buffer(packet[:sq_header.size], sq_header.size)
-    data = sq_header.unpack_from(buffer)
-    magic, version, pkt_type = data[:3]
-    if magic != SQ_MAGIC or version < SQ_VERSION:
-      raise IOError("SQS packet error")
+  def profile(self, seconds):
+    """Run the sampling profiler for `seconds`, 0 stops it"""
+    sq_struct = struct.Struct('!IHHH')
+    return sq_struct.pack(SQ_MAGIC, SQ_VERSION, SQ_PROFILE, seconds)
 
-    if pkt_type == SQ_HEARTBEAT:
-      return
-
-    elif pkt_type == SQ_PAUSE:
-      sq_struct = struct.Struct('!IHH?')
-      buffer = ctypes.create_string_buffer(packet, sq_struct.size)
-      data = sq_struct.unpack_from(buffer)
-      magic, version, pkt_type, pause = data
-      self._pause = pause
+  @staticmethod
+  def profile_duration(packet):
+    """Duration in seconds, None when the packet is truncated"""
+    if len(packet) < SQ_HEADER.size + 2:
+      return None
+    return struct.unpack_from('!H', packet, SQ_HEADER.size)[0]
 
+  def encode(self):
+    return data_packet(self._max_tries, self.xmit, self._pause, self._shutdown, self.call)
 
+  def decode(self, packet):
+    pkt_type, fields = parse(packet)
+    if pkt_type == SQ_PAUSE:
+      self._pause = fields['pause']
     elif pkt_type == SQ_DATA:
-      buffer = ctypes.create_string_buffer(packet, SQ_STRUCT.size)
-      data = SQ_STRUCT.unpack_from(buffer)
-      magic, version, pkt_type, max_tries, xmit, pause, shutdown, call = data
-      self._max_tries = max_tries
-      self.xmit = xmit
-      self._call = call.strip(b'\0x00')
-      self._pause = pause
-      self._shutdown = shutdown
+      self._max_tries = fields['max_tries']
+      self.xmit = fields['xmit']
+      self.call = fields['call']
+      self._pause = fields['pause']
+      self._shutdown = fields['shutdown']
 
   @property
   def max_tries(self):
@@ -135,23 +164,5 @@ class SQStatus:
     assert isinstance(val, str)
     self._call = val[:10].upper().encode('utf-8')
 
-  @property
-  def ip_wsjt(self):
-    return self._ip_wsjt
-
-  @ip_wsjt.setter
-  def ip_wsjt(self, val):
-    assert isinstance(val, tuple), "socket tuple expected"
-    self._ip_wsjt = val
-
-  @property
-  def ip_monit(self):
-    return self._ip_monit
-
-  @ip_monit.setter
-  def ip_monit(self, val):
-    assert isinstance(val, tuple), "socket tuple expected"
-    self._ip_monit = val
-
   def is_pause(self):
     return self._pause
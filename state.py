@@ -0,0 +1,113 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Immutable, versioned state of the sequencer.
+
+The threads never modify the state in place. A writer applies a
+command, a function returning the fields to change, to the `StateStore`.
+The writers are serialized by a lock, each change publishes a new
+`SQState` with the next version number by swapping one reference. A
+reader takes `store.state` once and works on a consistent snapshot, the
+readers never take the lock.
+
+  store.update(call='W6BSD', xmit=3)
+  store.apply(lambda state: {'xmit': state.xmit - 1})
+
+The console packet is encoded once per version.
+"""
+
+import logging
+import threading
+
+from collections import namedtuple
+
+import sqstatus
+
+LOG = logging.getLogger('State')
+
+FIELDS = ('version', 'call', 'xmit', 'max_tries', 'pause', 'shutdown', 'ip_wsjt', 'band')
+
+
+class SQState(namedtuple('SQState', FIELDS)):
+  __slots__ = ()
+
+  def __repr__(self):
+    msg = ("<SQState v{0.version}> Xmit:{0.xmit} Max_Tries: {0.max_tries} "
+           "Call: {0.call} Pause: {0.pause}")
+    return msg.format(self)
+
+  def is_pause(self):
+    return self.pause
+
+  def encode(self):
+    return sqstatus.data_packet(self.max_tries, self.xmit, self.pause, self.shutdown, self.call)
+
+
+def _normalize(changes):
+  """Same rules as the SQStatus setters"""
+  if 'xmit' in changes:
+    changes['xmit'] = max(0, changes['xmit'])
+    if changes['xmit'] == 0:
+      changes.setdefault('call', '')
+  if 'call' in changes:
+    changes['call'] = changes['call'][:10].upper()
+  return changes
+
+
+class StateStore:
+
+  def __init__(self):
+    self._state = SQState(version=0, call='', xmit=0, max_tries=sqstatus.XMIT_MAXRETRY,
+                          pause=False, shutdown=False, ip_wsjt=None, band=None)
+    self._lock = threading.Lock()
+    self._packet = (-1, b'')
+
+  def __repr__(self):
+    return repr(self._state)
+
+  @property
+  def state(self):
+    return self._state
+
+  def apply(self, command):
+    """Apply the command to the current state, return the new state"""
+    with self._lock:
+      state = self._state
+      changes = command(state)
+      if changes:
+        new = state._replace(**_normalize(dict(changes)))
+        if new != state:
+          self._state = new._replace(version=state.version + 1)
+      return self._state
+
+  def update(self, **changes):
+    return self.apply(lambda _: changes)
+
+  def pause(self, flag=True):
+    return self.update(pause=flag, xmit=0, call='')
+
+  def set_max_tries(self, val):
+    assert isinstance(val, int)
+    if not 1 < val < 15:
+      raise ValueError('The max_tries value must be between 1 and 15')
+    return self.update(max_tries=val)
+
+  def decode(self, packet):
+    """Apply a console command"""
+    pkt_type, fields = sqstatus.parse(packet)
+    if fields:
+      LOG.debug('Console command type %d: %s', pkt_type, fields)
+      self.update(**fields)
+
+  def encode(self):
+    """Console packet of the current state"""
+    state = self._state
+    version, packet = self._packet
+    if version != state.version:
+      packet = state.encode()
+      self._packet = (state.version, packet)
+    return packet
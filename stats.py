@@ -0,0 +1,182 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Response rate statistics.
+
+For every call made, and every reply received from the called station,
+exponentially weighted counters are updated in fixed size arrays, by
+azimuth sector, grid field, band and hour. The counters decay with a
+time constant of `TAU` seconds, the decay is only applied to the bucket
+being updated, an update is O(1).
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import logbook
+
+from config import Config
+
+LOG = logging.getLogger('Stats')
+
+TAU = 7 * 86400                 # Time constant of the counters
+SAVE_INTERVAL = 300
+PENDING_TIME = 120              # How long we wait for a reply
+PRIOR_RATE = .2                 # Rate of an empty bucket
+PRIOR_WEIGHT = 2
+
+BAND_NAMES = [name for _, _, name in logbook.BANDS]
+
+# Name, number of buckets
+DIMENSIONS = (
+  ('sector', 36),
+  ('field', 18 * 18),
+  ('band', len(BAND_NAMES) + 1),
+  ('hour', 24),
+)
+
+
+def buckets(direction, grid, band, hour):
+  """Bucket index of each dimension"""
+  if grid and len(grid) >= 2:
+    field = ((ord(grid[0]) - 65) % 18) * 18 + (ord(grid[1]) - 65) % 18
+  else:
+    field = 0
+  band = BAND_NAMES.index(band) if band in BAND_NAMES else len(BAND_NAMES)
+  return (int(direction) // 10 % 36, field, band, hour % 24)
+
+
+class ReplyStats:
+  """Singleton, the counters are saved in `stats_file`"""
+  _instance = None
+
+  def __new__(cls, *args, **kwargs):
+    if cls._instance is None:
+      cls._instance = super(ReplyStats, cls).__new__(cls)
+      cls._instance.counters = None
+    return cls._instance
+
+  def __init__(self, filename=None):
+    if self.counters is not None:
+      return
+
+    # counters[dim][0] calls, counters[dim][1] replies, stamps[dim] last update
+    self.counters = [np.zeros((2, size)) for _, size in DIMENSIONS]
+    self.stamps = [np.zeros(size) for _, size in DIMENSIONS]
+    self.pending = {}             # call: (last call time, keys, replied)
+    self._lock = threading.Lock()
+    self._last_save = time.time()
+    self.filename = filename or Config().get('stats_file')
+    if self.filename:
+      self.filename = os.path.expanduser(self.filename)
+      if os.path.exists(self.filename):
+        self.load()
+
+  def _update(self, keys, counter, now):
+    for dim, key in enumerate(keys):
+      decay = math.exp((self.stamps[dim][key] - now) / TAU)
+      self.counters[dim][:, key] *= decay
+      self.counters[dim][counter, key] += 1
+      self.stamps[dim][key] = now
+
+  def called(self, record, band, now=None):
+    """We just transmitted to the station in record. Only the first call
+    of an exchange is an attempt, the exchange ends PENDING_TIME seconds
+    after our last transmission to the station."""
+    now = now or time.time()
+    call = record['call']
+    with self._lock:
+      if call in self.pending:
+        _, keys, replied = self.pending[call]
+      else:
+        keys = buckets(record.get('direction', 0), record.get('grid'), band,
+                       time.gmtime(now).tm_hour)
+        self._update(keys, 0, now)
+        replied = False
+      self.pending[call] = (now, keys, replied)
+
+      for key in [k for k, (stamp, _, _) in self.pending.items() if stamp < now - PENDING_TIME]:
+        del self.pending[key]
+    self.autosave(now)
+
+  def replied(self, call, now=None):
+    """The station `call` answered us, only the first reply of an exchange counts"""
+    with self._lock:
+      if call not in self.pending:
+        return
+      stamp, keys, replied = self.pending[call]
+      if replied:
+        return
+      self.pending[call] = (stamp, keys, True)
+      self._update(keys, 1, now or time.time())
+
+  def rate(self, direction, grid, band, hour=None):
+    """Expected reply rate of one station"""
+    return float(self.rates([direction], [grid], [band], hour)[0])
+
+  def rates(self, directions, grids, bands, hour=None, now=None):
+    """Expected reply rates, the geometric mean of the rates in each dimension"""
+    now = now or time.time()
+    if hour is None:
+      hour = time.gmtime(now).tm_hour
+    keys = np.array([buckets(d, g, b, hour) for d, g, b in zip(directions, grids, bands)],
+                    dtype=int).reshape(-1, len(DIMENSIONS))
+    log_rate = np.zeros(len(keys))
+    for dim in range(len(DIMENSIONS)):
+      key = keys[:, dim]
+      decay = np.exp((self.stamps[dim][key] - now) / TAU)
+      calls, replies = self.counters[dim][:, key] * decay
+      log_rate += np.log((replies + PRIOR_RATE * PRIOR_WEIGHT) / (calls + PRIOR_WEIGHT))
+    return np.exp(log_rate / len(DIMENSIONS))
+
+  def get_state(self):
+    """Copy of the state, the transmit thread keeps updating it"""
+    with self._lock:
+      return {'counters': [c.copy() for c in self.counters],
+              'stamps': [s.copy() for s in self.stamps], 'pending': dict(self.pending)}
+
+  def set_state(self, state):
+    if [c.shape for c in state['counters']] != [c.shape for c in self.counters]:
+      LOG.warning('Stats dimensions changed, snapshot ignored')
+      return
+    with self._lock:
+      self.counters = state['counters']
+      self.stamps = state['stamps']
+      self.pending = state['pending']
+
+  def autosave(self, now):
+    if not self.filename or now - self._last_save < SAVE_INTERVAL:
+      return
+    self._last_save = now
+    self.save()
+
+  def save(self):
+    if not self.filename:
+      return
+    arrays = {}
+    for dim, (name, _) in enumerate(DIMENSIONS):
+      arrays[name] = self.counters[dim]
+      arrays[name + '_stamps'] = self.stamps[dim]
+    tmp_file = self.filename + '.tmp'
+    with open(tmp_file, 'wb') as fdout:
+      np.savez(fdout, **arrays)
+    os.replace(tmp_file, self.filename)
+
+  def load(self):
+    with np.load(self.filename) as arrays:
+      for dim, (name, size) in enumerate(DIMENSIONS):
+        if arrays[name].shape != (2, size):
+          LOG.warning('Stats file %s: dimension %s changed, ignored', self.filename, name)
+          continue
+        self.counters[dim] = arrays[name].copy()
+        self.stamps[dim] = arrays[name + '_stamps'].copy()
+    LOG.info('Reply statistics loaded from %s', self.filename)
@@ -0,0 +1,321 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+MongoDB access with timeouts, latency histograms and a circuit breaker.
+
+`Storage` is used like a pymongo database: `storage.calls.find(...)`.
+The reads and writes of the `calls` and `black` collections, the hot
+path of the sequencer, run with the `mongo_timeout`. The other calls
+(index builds, history and activity flushes) have a longer socket
+timeout, BULK_TIMEOUT. The latency of every call is recorded by
+collection and method. A call failing to reach the server, or
+FAILURE_THRESHOLD consecutive slow hot path calls, open the circuit and
+the sequencer runs in degraded mode:
+
+- the reads are served from an in-memory copy of the recent `calls` and
+  `black` documents, kept up to date by every write.
+- the writes are buffered, up to MAX_BUFFER, and replayed in order.
+- the other calls are skipped with a warning.
+
+A background thread pings the server every RETRY_INTERVAL seconds, and
+closes the circuit once the buffered writes are replayed. A buffered
+write rejected by the server is dropped.
+"""
+
+import logging
+import re
+import threading
+import time
+
+from collections import deque
+
+from pymongo import ASCENDING
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+from pymongo.errors import PyMongoError
+
+import metrics
+
+LOG = logging.getLogger('Storage')
+
+DB_TIMEOUT = 500                # Milliseconds
+BULK_TIMEOUT = 30000            # Milliseconds
+SLOW_CALL = .25                 # Seconds
+FAILURE_THRESHOLD = 3
+RETRY_INTERVAL = 15
+MAX_BUFFER = 10000
+MEMORY_TIME = {'calls': ('timestamp', 900), 'black': ('time', 86400)}
+
+READS = ('find', 'find_one', 'count_documents')
+WRITES = ('update_one', 'delete_many')
+
+
+_UNSUPPORTED = set()
+
+
+def _compare(value, operator, operand):
+  # pylint: disable=too-many-return-statements
+  if operator == '$exists':
+    return (value is not None) == bool(operand)
+  if operator == '$in':
+    return value in operand
+  if operator == '$nin':
+    return value not in operand
+  if operator == '$ne':
+    return value != operand
+  if operator == '$not':
+    return not _match_value(value, operand)
+  if operator == '$regex':
+    return isinstance(value, str) and bool(re.search(operand, value))
+  if value is None:
+    return False
+  if operator == '$gt':
+    return value > operand
+  if operator == '$gte':
+    return value >= operand
+  if operator == '$lt':
+    return value < operand
+  if operator == '$lte':
+    return value <= operand
+  if operator not in _UNSUPPORTED:
+    _UNSUPPORTED.add(operator)
+    LOG.warning('Operator %s not supported in degraded mode, no document matches', operator)
+  return False
+
+
+def _match_value(value, condition):
+  if isinstance(condition, re.Pattern):
+    return isinstance(value, str) and bool(condition.search(value))
+  if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+    return all(_compare(value, op, operand) for op, operand in condition.items())
+  return value == condition
+
+
+def match(doc, query):
+  """Evaluate the subset of the MongoDB queries used by the sequencer"""
+  for key, condition in (query or {}).items():
+    if key == '$and':
+      matched = all(match(doc, sub) for sub in condition)
+    elif key == '$or':
+      matched = any(match(doc, sub) for sub in condition)
+    else:
+      matched = _match_value(doc.get(key), condition)
+    if not matched:
+      return False
+  return True
+
+
+def project(doc, projection):
+  """Apply an inclusion or an exclusion projection"""
+  if not projection:
+    return dict(doc)
+  if isinstance(projection, (list, tuple)):
+    projection = {key: 1 for key in projection}
+  if any(value for key, value in projection.items() if key != '_id'):
+    keep = {key for key, value in projection.items() if value}
+    if projection.get('_id', 1):
+      keep.add('_id')
+    return {key: value for key, value in doc.items() if key in keep}
+  return {key: value for key, value in doc.items() if projection.get(key, 1)}
+
+
+def sort_docs(docs, sort):
+  """Sort like the `sort` argument of find, a key or a list of (key, direction)"""
+  if isinstance(sort, str):
+    sort = [(sort, ASCENDING)]
+  for key, direction in reversed(sort):
+    # None sorts first, like the missing fields in MongoDB
+    docs.sort(key=lambda doc, k=key: (doc.get(k) is not None, doc.get(k)),
+              reverse=direction != ASCENDING)
+  return docs
+
+
+class MemoryCollection:
+  """Recent documents of a collection, indexed by call. The ingest and
+  transmit threads write to it, the writes and the scans hold the lock."""
+
+  def __init__(self):
+    self.docs = {}
+    self._lock = threading.Lock()
+
+  def update_one(self, query, update, upsert=False):
+    with self._lock:
+      doc = self.docs.get(query.get('call'))
+      if doc is None:
+        if not upsert or 'call' not in query:
+          return
+        doc = self.docs[query['call']] = dict(query)
+      doc.update(update.get('$set', {}))
+
+  def delete_many(self, query):
+    with self._lock:
+      for key in [k for k, doc in list(self.docs.items()) if match(doc, query)]:
+        del self.docs[key]
+
+  def values(self):
+    with self._lock:
+      return list(self.docs.values())
+
+  def find(self, query=None, projection=None, sort=None, limit=0, **_kwargs):
+    docs = [doc for doc in self.values() if match(doc, query)]
+    if sort:
+      docs = sort_docs(docs, sort)
+    if limit:
+      docs = docs[:limit]
+    return [project(doc, projection) for doc in docs]
+
+  def find_one(self, query=None, projection=None, **kwargs):
+    docs = self.find(query, projection, limit=1, **kwargs)
+    return docs[0] if docs else None
+
+  def count_documents(self, query, **_kwargs):
+    return len([doc for doc in self.values() if match(doc, query)])
+
+  def expire(self, field, limit):
+    with self._lock:
+      for key in [k for k, doc in list(self.docs.items()) if doc.get(field, limit) < limit]:
+        del self.docs[key]
+
+
+class Collection:
+
+  def __init__(self, storage, name):
+    self.storage = storage
+    self.name = name
+
+  def __getattr__(self, method):
+    def _call(*args, **kwargs):
+      return self.storage.call(self.name, method, args, kwargs)
+    return _call
+
+
+class Storage:
+
+  def __init__(self, server, database='wsjt', timeout=DB_TIMEOUT):
+    self.client = MongoClient(server, serverSelectionTimeoutMS=timeout,
+                              connectTimeoutMS=timeout, socketTimeoutMS=BULK_TIMEOUT)
+    self.db = self.client[database]
+    # The hot path calls have a short socket timeout
+    self.fast = MongoClient(server, serverSelectionTimeoutMS=timeout,
+                            connectTimeoutMS=timeout, socketTimeoutMS=timeout)[database]
+    self.memory = {name: MemoryCollection() for name in MEMORY_TIME}
+    self.degraded = False
+    self.failures = 0
+    self.buffer = deque()
+    self.dropped = 0
+    self._collections = {}
+    self._lock = threading.Lock()
+
+  def __getitem__(self, name):
+    if name not in self._collections:
+      self._collections[name] = Collection(self, name)
+    return self._collections[name]
+
+  def __getattr__(self, name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+    return self[name]
+
+  @staticmethod
+  def histogram(name, method):
+    return metrics.DB_LATENCY.labels('{}.{}'.format(name, method))
+
+  def call(self, name, method, args, kwargs):
+    memory = self.memory.get(name)
+    if memory is not None and method in WRITES:
+      getattr(memory, method)(*args, **kwargs)
+    if self.degraded:
+      return self._degraded(name, method, args, kwargs)
+    try:
+      return self._execute(name, method, args, kwargs)
+    except ConnectionFailure as err:
+      LOG.warning('%s.%s: %s', name, method, err)
+      self._failure(FAILURE_THRESHOLD)
+      return self._degraded(name, method, args, kwargs)
+
+  def _execute(self, name, method, args, kwargs):
+    hot = name in self.memory and method in READS + WRITES
+    start = time.perf_counter()
+    result = getattr((self.fast if hot else self.db)[name], method)(*args, **kwargs)
+    if method == 'find':
+      result = list(result)
+    elapsed = time.perf_counter() - start
+    self.histogram(name, method).observe(elapsed)
+    if not hot:
+      return result
+    if elapsed > SLOW_CALL:
+      LOG.warning('%s.%s: slow call %.3fs', name, method, elapsed)
+      self._failure()
+    else:
+      self.failures = 0
+    return result
+
+  def _degraded(self, name, method, args, kwargs):
+    if method in WRITES:
+      with self._lock:
+        if self.degraded:
+          if len(self.buffer) >= MAX_BUFFER:
+            self.buffer.popleft()
+            self.dropped += 1
+          self.buffer.append((name, method, args, kwargs))
+          return None
+      return self.call(name, method, args, kwargs)
+
+    memory = self.memory.get(name)
+    if method in READS and memory is not None:
+      return getattr(memory, method)(*args, **kwargs)
+    LOG.warning('%s.%s skipped in degraded mode', name, method)
+    return {'find': [], 'count_documents': 0}.get(method)
+
+  def _failure(self, count=1):
+    self.failures += count
+    with self._lock:
+      if self.failures < FAILURE_THRESHOLD or self.degraded:
+        return
+      self.degraded = True
+    LOG.error('Database unavailable, running in degraded mode')
+    threading.Thread(target=self._recover, daemon=True, name='StorageRecover').start()
+
+  def _recover(self):
+    while True:
+      time.sleep(RETRY_INTERVAL)
+      try:
+        self.client.admin.command('ping')
+        count = self._replay()
+      except PyMongoError as err:
+        LOG.info('Database still unavailable: %s', err)
+        continue
+      self.failures = 0
+      LOG.warning('Database available, %d writes replayed, %d dropped', count, self.dropped)
+      self.dropped = 0
+      return
+
+  def _replay(self):
+    count = 0
+    while True:
+      with self._lock:
+        if not self.buffer:
+          self.degraded = False
+          return count
+        name, method, args, kwargs = self.buffer[0]
+      try:
+        getattr(self.db[name], method)(*args, **kwargs)
+        count += 1
+      except Exception as err:  # pylint: disable=broad-except
+        if isinstance(err, ConnectionFailure):
+          raise
+        # Rejected by the server, it would fail again
+        LOG.error('%s.%s dropped: %s', name, method, err)
+        self.dropped += 1
+      with self._lock:
+        self.buffer.popleft()
+
+  def expire(self, now=None):
+    """Remove the old documents from the in-memory collections"""
+    now = now or time.time()
+    for name, (field, max_age) in MEMORY_TIME.items():
+      self.memory[name].expire(field, now - max_age)
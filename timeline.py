@@ -0,0 +1,94 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Timeline of each slot.
+
+The sequencer threads mark the steps of a slot: first and last decode
+received, WSJT-X done decoding, candidates snapshot built, selector
+returned, reply sent, WSJT-X transmitting. The timelines of the last
+MAX_SLOTS slots are kept in a ring buffer. They can be dumped, or
+written in the Chrome trace event format, viewable in chrome://tracing
+or https://ui.perfetto.dev.
+
+A slot starts SLOT_OFFSET seconds after the start of the FT8 period:
+the decodes, the selection and the reply of a period, and the start of
+the transmission of the next one, fall in the same slot.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+LOG = logging.getLogger('Timeline')
+
+SLOT_LENGTH = 15
+SLOT_OFFSET = 5
+MAX_SLOTS = 240
+
+_SLOTS = OrderedDict()
+# Reentrant, the SIGUSR1 handler writing the trace can interrupt mark()
+_LOCK = threading.RLock()
+
+
+def slot_id(now):
+  return int(now - SLOT_OFFSET) // SLOT_LENGTH
+
+
+def mark(event, first=False):
+  """Record the time of an event in the current slot. With `first`,
+  only the first occurrence of the event in the slot is kept."""
+  now = time.time()
+  slot = slot_id(now)
+  with _LOCK:
+    events = _SLOTS.get(slot)
+    if events is None:
+      events = _SLOTS[slot] = {}
+      while len(_SLOTS) > MAX_SLOTS:
+        _SLOTS.popitem(last=False)
+    if first and event in events:
+      return
+    events[event] = (now, threading.current_thread().name)
+
+
+def _copy():
+  with _LOCK:
+    return [(slot, dict(events)) for slot, events in _SLOTS.items()]
+
+
+def dump():
+  """List of the slots, with the events offsets in milliseconds from the slot start"""
+  slots = []
+  for slot, events in _copy():
+    start = slot * SLOT_LENGTH + SLOT_OFFSET
+    slots.append({
+      'slot': time.strftime('%H:%M:%S', time.gmtime(start)),
+      'events': {name: round((stamp - start) * 1000, 1)
+                 for name, (stamp, _) in sorted(events.items(), key=lambda e: e[1][0])},
+    })
+  return slots
+
+
+def chrome_trace(filename):
+  """Write the timelines in the Chrome trace event format"""
+  trace = []
+  threads = {}
+  slots = _copy()
+  for slot, events in slots:
+    start = (slot * SLOT_LENGTH + SLOT_OFFSET) * 1e6
+    trace.append({'name': 'slot', 'ph': 'X', 'ts': start, 'dur': SLOT_LENGTH * 1e6,
+                  'pid': 1, 'tid': 0})
+    for name, (stamp, thread) in events.items():
+      tid = threads.setdefault(thread, len(threads) + 1)
+      trace.append({'name': name, 'ph': 'i', 's': 't', 'ts': stamp * 1e6, 'pid': 1, 'tid': tid})
+  trace.extend({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread}}
+               for thread, tid in threads.items())
+  with open(filename, 'w') as fdout:
+    json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, fdout)
+  LOG.info('Timeline of %d slots written to %s', len(slots), filename)
@@ -13,34 +13,54 @@ import threading
 import time
 
 from datetime import datetime
-from importlib import import_module
 
+import metrics
+import plugins
+import shadow
+import stats
+import timeline
 import wsjtx
 
 from config import Config
+from decisionlog import Decision, DecisionLog, DECISION_FILE
+from executor import SelectorExecutor, SELECTOR_BUDGET
+from plugins.chain import Chain
 
 LOG = logging.getLogger('Transmit')
 # LOG.setLevel(logging.DEBUG)
 
 class Transmit(threading.Thread):
 
-  def __init__(self, status, period, daemon=None):
+  def __init__(self, store, db, period, daemon=None):
     config = Config()
     if isinstance(period, range):
       period = list(period)
     super().__init__(daemon=daemon)
     self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     self.period = period
-    self.status = status
+    self.store = store
+    self.db = db
     self._killed = False
     # import the selector from plugins
-    *module_name, class_name = config.select_method.split('.')
-    module_name = '.'.join(['plugins'] + module_name)
-    module = import_module(module_name)
-    klass = getattr(module, class_name)
-    self.call_selector = klass(config, status.db)
+    if isinstance(config.select_method, list):
+      klass = Chain
+    else:
+      klass = plugins.get_class(config.select_method)
+    self.call_selector = SelectorExecutor(klass(config, db),
+                                          config.get('selector_budget', SELECTOR_BUDGET),
+                                          config.get('selector_process', False))
+    self.shadow = shadow.Shadow(config, db)
+    self.decisions = DecisionLog(config.get('decision_file', DECISION_FILE),
+                                 config.get('decision_max_size', 10) << 20)
     self.call = config.call
     self.follow_frequency = config.get('follow_frequency', True)
+    self._slot_start = time.monotonic()
+
+  def warmup(self):
+    """First selector pass, before the thread starts. It connects to the
+    database and loads the plugins data."""
+    call, _, _ = self.call_selector.get()
+    LOG.debug('Warm up: %s', call and call['call'])
 
   def wait(self):
     while True:
@@ -61,17 +81,19 @@ class Transmit(threading.Thread):
 
   def stop_transmit(self, flag):
     LOG.debug('Stop transmit')
-    if not self.status.ip_wsjt:
+    ip_wsjt = self.store.state.ip_wsjt
+    if not ip_wsjt:
       return
     stop_pkt = wsjtx.WSHaltTx()
     stop_pkt.tx = flag
     try:
-      self.sock.sendto(stop_pkt.raw(), self.status.ip_wsjt)
+      self.sock.sendto(stop_pkt.raw(), ip_wsjt)
     except:
-      logging.error(self.status.ip_wsjt)
+      logging.error(ip_wsjt)
       raise
 
-  def reply(self, call):
+  def reply(self, call, decided):
+    """Answer the call, `decided` is the monotonic time of the decision"""
     packet = wsjtx.WSReply()
     packet.call = call['call']
     packet.Time = call['Time']
@@ -83,64 +105,99 @@ class Transmit(threading.Thread):
     if self.follow_frequency:
       packet.Modifiers = wsjtx.Modifiers.SHIFT
 
-    LOG.debug('Transmiting %s', packet)
-    self.sock.sendto(packet.raw(), self.status.ip_wsjt)
+    LOG.debug('Transmiting %s', packet, extra={'call': call['call'], 'stage': 'reply'})
+    state = self.store.state
+    self.sock.sendto(packet.raw(), state.ip_wsjt)
+    timeline.mark('reply')
+    metrics.REPLY_LATENCY.observe(time.monotonic() - decided)
+    stats.ReplyStats().called(call, state.band)
 
   def run(self):
+    self.decisions.start()
     # Wait for the very end of the sequence
     while True:
-      LOG.info(self.status)
+      LOG.info(self.store.state)
       self.wait()
       if self._killed:
         break
 
-      LOG.info(self.status)
+      state = self.store.state
+      LOG.info(state)
+      self._slot_start = time.monotonic()
+      timeline.mark('transmit')
+      decision = Decision()
 
-      if self.status.is_pause():
+      if state.is_pause():
         self.stop_transmit(True)
-        self.status.xmit = 0
-        self.status.call = ''
-        while self.status.is_pause():
+        self.store.update(xmit=0, call='')
+        self.decisions.write(decision.done('pause'))
+        metrics.NO_TRANSMIT.inc('pause')
+        while self.store.state.is_pause():
           if self._killed:
             return
           time.sleep(.5)
         continue
 
-      if self.is_incontact(self.status.call):
+      if self.is_incontact(state.call):
         LOG.info('is_incontact')
-        self.status.call = ''
+        state = self.store.update(call='')
+      decision.stage('incontact')
 
-      call = self.is_inprogress(self.status.call)
+      call = self.is_inprogress(state.call)
+      decided = time.monotonic()
+      decision.stage('inprogress')
       if call:
-        LOG.info('is_inprogress: %s', call['Message'])
-        self.reply(call)
-        self.status.call = call['call']
+        LOG.info('is_inprogress: %s', call['Message'],
+                 extra={'call': call['call'], 'stage': 'inprogress'})
+        self.reply(call, decided)
+        decision.stage('reply')
+        self.decisions.write(decision.done('inprogress', call['call']))
+        self.store.update(call=call['call'])
         continue
 
       call = self.run_pileup()
+      decided = time.monotonic()
+      decision.stage('pileup')
       if call:
-        LOG.info('run_pileup: %s', call['Message'])
-        self.reply(call)
-        self.status.call = call['call']
+        LOG.info('run_pileup: %s', call['Message'], extra={'call': call['call'], 'stage': 'pileup'})
+        self.reply(call, decided)
+        decision.stage('reply')
+        self.decisions.write(decision.done('pileup', call['call']))
+        self.store.update(call=call['call'])
         continue
 
-      self.status.xmit -= 1
-      if not self.status.call or not self.status.xmit:
-        call = self.call_selector.get()
+      state = self.store.apply(lambda state: {'xmit': state.xmit - 1})
+      if not state.call or not state.xmit:
+        call, snapshot, scores = self.call_selector.get()
+        decided = time.monotonic()
+        decision.stage('selector')
+        decision.candidates(snapshot, scores)
         if call:
-          LOG.info('%s: %s', self.call_selector, call['Message'])
-          self.reply(call)
-          self.status.call = call['call']
-          self.status.xmit = self.status.max_tries
-          self.status.db.black.update_one(
+          LOG.info('%s: %s', self.call_selector, call['Message'],
+                   extra={'call': call['call'], 'stage': 'selector',
+                          'latency': decided - self._slot_start})
+          self.reply(call, decided)
+          decision.stage('reply')
+          self.decisions.write(decision.done('selector', call['call']))
+          self.shadow.submit(snapshot, call['call'])
+          self.store.apply(lambda state, call=call['call']: {'call': call, 'xmit': state.max_tries})
+          self.db.black.update_one(
             {"call": call['call']},
             {"$set": {"time": Transmit.timestamp(), "logged": False}},
             upsert=True)
           continue
         else:
           LOG.critical('Stop Transmit')
+          self.decisions.write(decision.done('nocall'))
+          metrics.NO_TRANSMIT.inc('nocall')
+          self.shadow.submit(snapshot, None)
+      else:
+        self.decisions.write(decision.done('calling', state.call))
 
     # Exit
+    self.call_selector.shutdown()
+    self.shadow.shutdown()
+    self.decisions.shutdown()
     self.sock.close()
 
   def is_incontact(self, call):
@@ -150,7 +207,7 @@ class Transmit(threading.Thread):
       "to": {"$not": exp},
       "timestamp": {"$gt": Transmit.timestamp() - 15},
     }
-    return bool(self.status.db.calls.count_documents(request))
+    return bool(self.db.calls.count_documents(request))
 
   def is_inprogress(self, call):
     request =  {
@@ -161,7 +218,7 @@ class Transmit(threading.Thread):
       return
 
     LOG.debug('req = %s', request)
-    record = self.status.db.calls.find_one(request)
+    record = self.db.calls.find_one(request)
     if not record or record['to'] not in ('CQ',  self.call):
       record = None
     return record
@@ -174,7 +231,7 @@ class Transmit(threading.Thread):
     }
 
     LOG.debug('req = %s', request)
-    record = self.status.db.calls.find(request)
+    record = self.db.calls.find(request)
     for call in record:
       coef = Transmit.coefficient(call['distance'], call['SNR'])
       calls.append((coef, call))
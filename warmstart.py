@@ -0,0 +1,99 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2021, Fred W6BSD
+# All rights reserved.
+#
+"""
+Snapshots of the sequencer's hot state.
+
+The QSO in progress, the stations heard in the last minute, the reply
+statistics and the activity rollups are saved every minute in the
+`snapshot_file`, as a compressed pickle. The file is written next to
+the old one and renamed, a crash never leaves a partial snapshot.
+
+At startup the state is restored from the snapshot, then the stations
+decoded after the snapshot are read from the calls collection with one
+range query on the timestamp index.
+"""
+
+import logging
+import os
+import pickle
+import time
+import zlib
+
+import rollup
+import spatial
+import stats
+
+LOG = logging.getLogger('WarmStart')
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_INTERVAL = 60
+QSO_MAX_AGE = 120               # An older QSO in progress is not restored
+
+
+class WarmStart:
+
+  def __init__(self, filename, store):
+    self.filename = os.path.expanduser(filename)
+    self.store = store
+    self._last_save = time.time()
+
+  def autosave(self, now=None):
+    now = now or time.time()
+    if now - self._last_save < SNAPSHOT_INTERVAL:
+      return
+    self._last_save = now
+    self.save()
+
+  def save(self):
+    start = time.perf_counter()
+    qso = self.store.state
+    state = {
+      'version': SNAPSHOT_VERSION,
+      'time': time.time(),
+      'qso': {'call': qso.call, 'xmit': qso.xmit, 'pause': qso.pause, 'band': qso.band},
+      'stations': spatial.RecentStations().get_state(),
+      'stats': stats.ReplyStats().get_state(),
+      'activity': rollup.Activity().get_state(),
+    }
+    tmp_file = self.filename + '.tmp'
+    with open(tmp_file, 'wb') as fdout:
+      fdout.write(zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1))
+    os.replace(tmp_file, self.filename)
+    LOG.debug('Snapshot saved in %.3fs', time.perf_counter() - start)
+
+  def restore(self, db):
+    """Restore the last snapshot and catch up with the decodes received since"""
+    if not os.path.exists(self.filename):
+      return
+    try:
+      with open(self.filename, 'rb') as fdin:
+        state = pickle.loads(zlib.decompress(fdin.read()))
+    except (OSError, EOFError, zlib.error, pickle.UnpicklingError) as err:
+      LOG.warning('Cannot read the snapshot %s: %s', self.filename, err)
+      return
+    if state.get('version') != SNAPSHOT_VERSION:
+      LOG.warning('Snapshot %s version %s ignored', self.filename, state.get('version'))
+      return
+
+    qso = state['qso']
+    self.store.update(band=qso['band'])
+    if qso['pause']:
+      self.store.pause(True)
+    if qso['call'] and time.time() - state['time'] < QSO_MAX_AGE:
+      self.store.update(call=qso['call'], xmit=qso['xmit'])
+      LOG.info('QSO with %s restored, xmit: %d', qso['call'], qso['xmit'])
+    stats.ReplyStats().set_state(state['stats'])
+    rollup.Activity().set_state(state['activity'])
+
+    recent = spatial.RecentStations()
+    recent.set_state(state['stations'])
+    since = max(state['time'], time.time() - recent.recent_time)
+    for obj in db.calls.find({'timestamp': {'$gt': since}, 'distance': {'$exists': True}},
+                             {'call': 1, 'direction': 1, 'distance': 1, 'timestamp': 1}):
+      recent.add(obj['call'], obj['direction'], obj['distance'], obj['timestamp'])
+    LOG.info('Snapshot from %s restored, %d recent stations',
+             time.strftime('%H:%M:%S', time.gmtime(state['time'])), len(recent))